@@ -0,0 +1,177 @@
+"""
+Micro-benchmarks of the frontend's stats pipeline on synthetic data (see generate.py), at several sizes.
+
+    python bench/benchmark.py                    # report
+    python bench/benchmark.py --save-baseline    # store the results in bench/baseline.json
+    python bench/benchmark.py --check            # exit 1 if a stage got slower than the baseline allows
+                                                 # (skipped with a message if there is no baseline yet)
+
+Every stage runs --repeat times and the fastest run counts, peak memory is measured in one extra
+run under tracemalloc. Baselines only compare on the machine they were recorded on.
+"""
+import tracemalloc
+import statistics
+import argparse
+import tempfile
+import time
+import json
+import sys
+import os
+
+from generate import ROOT, generate, get_data_payload
+
+import typing as _ty
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SIZES = (50, 200, 1000)  # Sessions, of --games-per-session games each
+
+
+def load_frontend(workdir: str):
+    """The frontend's main module, with its database (data.db) in workdir."""
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.join(ROOT, "frontend_server", "src"))
+    import main
+    return main
+
+
+def measure(func: _ty.Callable[[], _ty.Any], repeat: int, setup: _ty.Callable[[], None] | None = None) -> dict[str, float]:
+    """Fastest and median seconds of repeat runs, and the peak traced memory of one more."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(times), "median": statistics.median(times), "peak_bytes": peak}
+
+
+def run(sizes: _ty.Sequence[int], players: int, games_per_session: int, repeat: int) -> dict[str, dict[str, _ty.Any]]:
+    """{"<stage>@<sessions>": {seconds, median, peak_bytes, rounds, rounds_per_s}}, in a temporary directory."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="romee-bench-") as workdir:
+        main = load_frontend(workdir)
+        try:
+            return run_stages(main, sizes, players, games_per_session, repeat)
+        finally:
+            main.DB.close_all()
+            os.chdir(cwd)
+
+
+def run_stages(main, sizes: _ty.Sequence[int], players: int, games_per_session: int,
+               repeat: int) -> dict[str, dict[str, _ty.Any]]:
+    from incremental import IncrementalStats
+
+    client = main.app.test_client()
+    results: dict[str, dict[str, _ty.Any]] = {}
+    for sessions in sizes:
+        player_list, games, hands = generate(players, sessions, games_per_session, seed=sessions)
+        payload = get_data_payload(player_list, games, hands)
+
+        def fresh_db():
+            main.create_db()
+            main.STATS = main._BUILDER = None
+
+        def load_payload():
+            with main.write_transaction(main.get_writer_db()):
+                main.update_db_from_json(payload)
+
+        stages: dict[str, dict[str, float]] = {}
+        stages["update_db_from_json"] = measure(load_payload, repeat, setup=fresh_db)
+        rows = main.get_rounds()
+        players_now = main.get_players()
+        stages["get_rounds"] = measure(main.get_rounds, repeat)
+        stages["parse_rounds"] = measure(lambda: main.parse_rounds(rows, players_now), repeat)
+
+        def analyze():  # What the pages are served from, without the cache in front of it
+            state = IncrementalStats(players_now)
+            state.fold(rows)
+            state.acc.results(players_now)
+        stages["analyze_stats"] = measure(analyze, repeat)
+
+        def rebuild():
+            main._BUILDER = None
+            main.STATS_CACHE.clear()
+        stages["refresh_stats"] = measure(main.refresh_stats, repeat, setup=rebuild)
+
+        def render_global():
+            assert client.get("/global").status_code == 200
+        stages["/global"] = measure(render_global, repeat, setup=main.PAGE_CACHE.clear)
+        stages["/global (cached)"] = measure(render_global, repeat)
+        main.DB.release()
+
+        for stage, result in stages.items():
+            result["rounds"] = len(games)
+            result["rounds_per_s"] = len(games) / result["seconds"] if result["seconds"] else float("inf")
+            results[f"{stage}@{sessions}"] = result
+    return results
+
+
+def report(results: dict[str, dict[str, _ty.Any]], baseline: dict[str, dict[str, _ty.Any]] | None = None):
+    print(f"{'stage':<34}{'rounds':>9}{'best ms':>11}{'median ms':>11}{'rounds/s':>13}{'peak KiB':>11}"
+          + (f"{'vs base':>10}" if baseline else ""))
+    for key, result in results.items():
+        line = (f"{key:<34}{result['rounds']:>9}{result['seconds'] * 1000:>11.2f}{result['median'] * 1000:>11.2f}"
+                f"{result['rounds_per_s']:>13,.0f}{result['peak_bytes'] / 1024:>11,.0f}")
+        if baseline and key in baseline:
+            line += f"{result['seconds'] / baseline[key]['seconds']:>9.2f}x"
+        print(line)
+
+
+def regressions(results: dict[str, dict[str, _ty.Any]], baseline: dict[str, dict[str, _ty.Any]],
+                tolerance: float, min_seconds: float) -> list[str]:
+    """Stages slower than the baseline by more than tolerance (a fraction), ignoring differences below min_seconds."""
+    slower = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result["seconds"] > base["seconds"] * (1 + tolerance) and result["seconds"] - base["seconds"] > min_seconds:
+            slower.append(f"{key}: {result['seconds'] * 1000:.2f} ms, baseline {base['seconds'] * 1000:.2f} ms")
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the stats pipeline on synthetic data.")
+    parser.add_argument("--sizes", type=lambda arg: [int(size) for size in arg.split(",")], default=SIZES,
+                        help="comma-separated session counts (default %(default)s)")
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--games-per-session", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--check", action="store_true", help="fail if a stage regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown (default 25%%)")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="slowdowns below this are noise (default 1 ms)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = run(args.sizes, args.players, args.games_per_session, args.repeat)
+    report(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved the baseline to {args.baseline}")
+    if args.check and baseline is None:
+        print(f"No baseline at {args.baseline}, skipping the check (record one with --save-baseline)")
+    elif args.check:
+        slower = regressions(results, baseline, args.tolerance, args.min_ms / 1000)
+        for line in slower:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if slower else 0)
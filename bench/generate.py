@@ -0,0 +1,88 @@
+"""
+Synthetic Rommé data for benchmarks, in the shape create_db and /get_data use.
+
+    python bench/generate.py --sessions 500 --out data.db
+
+writes a data server database (through data_server/src/main.py create_db) that the frontend can sync from.
+"""
+import importlib.util
+import argparse
+import random
+import sys
+import os
+
+import typing as _ty
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Players = list[tuple[str, str]]
+Games = list[tuple[int, ...]]  # create_db's layout: 0 is a win, 1 absent, a row of only 1's ends the session
+Hands = dict[int, int]  # scores id -> flag
+
+
+def generate(players: int = 6, sessions: int = 100, games_per_session: int = 20, absence_rate: float = 0.2,
+             hand_rate: float = 0.05, seed: int = 0) -> tuple[Players, Games, Hands]:
+    """
+    players play sessions evenings of around games_per_session games. Every player misses an
+    evening with absence_rate (at least two are always there), every game has one winner and
+    is a Rommé hand (flagged) with hand_rate. Losers keep 5 to 120 points, mostly few.
+    """
+    rng = random.Random(seed)
+    names = [(f"Player {i + 1}", f"player{i + 1}") for i in range(players)]
+    games: Games = []
+    hands: Hands = {}
+    for _ in range(sessions):
+        present = [idx for idx in range(players) if rng.random() >= absence_rate]
+        while len(present) < min(2, players):
+            present = sorted(set(present) | {rng.randrange(players)})
+        for _ in range(max(1, round(rng.gauss(games_per_session, games_per_session / 4)))):
+            winner = rng.choice(present)
+            games.append(tuple(1 if idx not in present else 0 if idx == winner
+                               else 5 * max(1, min(24, round(rng.expovariate(1 / 6))))
+                               for idx in range(players)))
+            if rng.random() < hand_rate:
+                hands[len(games)] = 1
+        games.append((1,) * players)  # Session end
+    return names, games, hands
+
+
+def get_data_payload(players: Players, games: Games, hands: Hands) -> dict[str, _ty.Any]:
+    """The tables of a full /get_data response (columnar layout) for the data, as the frontend syncs them."""
+    colnames = [col for _, col in players]
+    return {
+        "players": {"columns": ["id", "name", "colname"],
+                    "rows": [[idx, name, col] for idx, (name, col) in enumerate(players, 1)]},
+        "scores": {"columns": ["id", *colnames],
+                   "rows": [[idx, *(None if value == 1 else value for value in row)] for idx, row in enumerate(games, 1)]},
+        "hands": {"columns": ["scores_id", "flag"], "rows": [[idx, flag] for idx, flag in hands.items()]},
+    }
+
+
+def write_data_db(path: str, players: Players, games: Games, hands: Hands):
+    """Create the data server database at path with its create_db."""
+    src = os.path.join(ROOT, "data_server", "src")
+    sys.path.insert(0, src)
+    try:
+        spec = importlib.util.spec_from_file_location("data_server_main", os.path.join(src, "main.py"))
+        data_server = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(data_server)
+    finally:
+        sys.path.remove(src)
+    data_server.DB_NAME = path
+    data_server.create_db(players, games, hands)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic data server database.")
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--games-per-session", type=int, default=20)
+    parser.add_argument("--absence-rate", type=float, default=0.2)
+    parser.add_argument("--hand-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="data.db")
+    args = parser.parse_args()
+
+    data = generate(args.players, args.sessions, args.games_per_session, args.absence_rate, args.hand_rate, args.seed)
+    write_data_db(args.out, *data)
+    print(f"Wrote {len(data[1])} rounds of {args.players} players in {args.sessions} sessions to {args.out}")
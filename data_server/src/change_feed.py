@@ -0,0 +1,79 @@
+"""Long-poll change notifications, driven by one background poller of PRAGMA data_version"""
+from collections import OrderedDict
+import threading
+import sqlite3
+import time
+
+import typing as _ty
+
+
+class ChangeFeed:
+    """
+    A single thread polls PRAGMA data_version every poll_interval seconds, it changes whenever
+    another connection commits. Only then is the (more expensive) data version recomputed and
+    the waiting requests woken up, so any number of waiters cost one cheap PRAGMA per interval.
+    """
+    def __init__(self, connect: _ty.Callable[[], sqlite3.Connection],
+                 snapshot: _ty.Callable[[sqlite3.Cursor], tuple[str, int]], poll_interval: float = 0.1,
+                 history: int = 256):
+        self.connect = connect
+        self.snapshot = snapshot  # cursor -> (data version, max scores id)
+        self.poll_interval = poll_interval
+        self.version: str | None = None
+        self.max_id = 0
+        self._max_ids: OrderedDict[str, int] = OrderedDict()  # Recent versions -> their max scores id
+        self._history = history
+        self._changed = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def _refresh(self, cursor: sqlite3.Cursor):
+        version, max_id = self.snapshot(cursor)
+        with self._changed:
+            if version != self.version:
+                self.version, self.max_id = version, max_id
+                self._max_ids[version] = max_id
+                while len(self._max_ids) > self._history:
+                    self._max_ids.popitem(last=False)
+                self._changed.notify_all()
+
+    def _poll(self):
+        db = self.connect()
+        try:
+            last = None
+            while True:
+                try:
+                    data_version = db.execute("PRAGMA data_version").fetchone()[0]
+                    if data_version != last:
+                        db.execute("BEGIN")  # One consistent read for the version and the max id
+                        try:
+                            self._refresh(db.cursor())
+                        finally:
+                            db.rollback()
+                        last = data_version
+                except sqlite3.Error:
+                    pass  # E.g. the tables are being recreated, try again next interval
+                time.sleep(self.poll_interval)
+        finally:
+            db.close()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._poll, name="change-feed", daemon=True)
+            self._thread.start()
+        with self._changed:
+            self._changed.wait_for(lambda: self.version is not None, timeout=5)
+
+    def wait(self, since: str | None, timeout: float) -> dict[str, _ty.Any]:
+        """
+        Block until the data version differs from since (or timeout seconds passed), then describe
+        the current state. from_id is the max scores id of since if it is a recent version: the new
+        rows are from_id < id <= max_id.
+        """
+        self.start()
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != since, timeout=timeout)
+            return {"changed": self.version != since, "version": self.version,
+                    "from_id": self._max_ids.get(since) if since is not None else None, "max_id": self.max_id}
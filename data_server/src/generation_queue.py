@@ -0,0 +1,124 @@
+"""Single-flight coalescing and bounded concurrency for the requests to the model host"""
+from contextlib import contextmanager
+import threading
+
+import typing as _ty
+
+
+class QueueFull(Exception):
+    """The model is saturated: too many requests are waiting, or one waited longer than the timeout."""
+
+
+class Flight:
+    """One in-flight generation, identical requests wait for its result instead of starting their own."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: _ty.Any = None
+        self.error: BaseException | None = None
+
+
+class GenerationQueue:
+    """
+    At most max_concurrent generations run at once, up to max_queued more wait for a slot
+    (for at most timeout seconds). Past that, requests are rejected with QueueFull right away.
+
+    Requests with the same key share one generation: the first one runs it, the others wait for its result.
+    """
+    def __init__(self, max_concurrent: int = 2, max_queued: int = 8, timeout: float = 120.0):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.active = self.waiting = 0
+        self.coalesced = self.rejected = self.timeouts = 0
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._flights: dict[str, Flight] = {}
+
+    def acquire(self):
+        """Wait for a generation slot, raises QueueFull. Pair with release()."""
+        with self._lock:
+            if self.active >= self.max_concurrent and self.waiting >= self.max_queued:
+                self.rejected += 1
+                raise QueueFull(f"{self.waiting} requests are already waiting for the model")
+            self.waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if not acquired:
+            with self._lock:
+                self.timeouts += 1
+            raise QueueFull(f"No generation slot became free within {self.timeout}s")
+        with self._lock:
+            self.active += 1
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    @contextmanager
+    def slot(self) -> _ty.Iterator[None]:
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def join(self, key: str) -> Flight | None:
+        """The flight currently generating key, None if there is none."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+            return flight
+
+    def lead(self, key: str) -> tuple[Flight, bool]:
+        """(flight, if the caller leads it): the existing flight for key, or a new one the caller has to finish()."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def finish(self, key: str, flight: Flight, result: _ty.Any = None, error: BaseException | None = None):
+        """Publish the result of a flight the caller leads, wakes every request waiting for it."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if not flight.done.is_set():
+            flight.result, flight.error = result, error
+            flight.done.set()
+
+    def wait(self, flight: Flight) -> _ty.Any:
+        """The result of a flight led by another request, raises its error or QueueFull on timeout."""
+        if not flight.done.wait(self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise QueueFull(f"The identical generation did not finish within {self.timeout}s")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def run(self, key: str, generate: _ty.Callable[[], _ty.Any]) -> _ty.Any:
+        """generate() in a slot, or the result of the identical generation that is already running."""
+        flight, leader = self.lead(key)
+        if not leader:
+            return self.wait(flight)
+        try:
+            with self.slot():
+                result = generate()
+        except BaseException as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, result)
+        return result
+
+    def info(self) -> dict[str, _ty.Any]:
+        with self._lock:
+            return dict(active=self.active, waiting=self.waiting, in_flight=len(self._flights),
+                        coalesced=self.coalesced, rejected=self.rejected, timeouts=self.timeouts,
+                        max_concurrent=self.max_concurrent, max_queued=self.max_queued, timeout=self.timeout)
@@ -0,0 +1,24 @@
+"""
+Production server, run from this directory: gunicorn -c gunicorn.conf.py
+
+The app is created once in the master before the workers are forked.
+Workers are recycled after MAX_REQUESTS requests, finishing what they are serving first.
+"""
+import os
+import gc
+
+wsgi_app = "main:create_app()"
+bind = os.environ.get("BIND", "0.0.0.0:8080")
+# The model queue (OLLAMA_QUEUE) and the coalescing of identical generations are per process,
+# a single worker keeps their limits exact. Long-polls and streams each hold a thread.
+workers = int(os.environ.get("WORKERS", 1))
+threads = int(os.environ.get("THREADS", 32))
+worker_class = "gthread"
+preload_app = True
+max_requests = int(os.environ.get("MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+graceful_timeout = 130  # Lets running generations (OLLAMA_QUEUE timeout) finish
+
+
+def pre_fork(server, worker):
+    gc.freeze()  # The collector never touches the preloaded objects, so their pages stay shared
@@ -0,0 +1,99 @@
+"""Answers to the simple numeric player_info questions, computed from the scores instead of asking the model"""
+import re
+
+from prompt_compaction import Games, final_score
+
+import typing as _ty
+
+# Questions that want an explanation or an opinion always go to the model
+FREE_FORM = re.compile(r"\b(why|how come|explain|compare|compared|versus|vs|better|worse than|should|could|would|"
+                       r"warum|wieso|weshalb|erkl[aä]r\w*|vergleich\w*|besser|schlechter)\b", re.IGNORECASE)
+# Words that narrow a question down (a session, a time, other players, a subset of the scores), the numbers
+# computed here are always over every game of the player, so those go to the model as well
+QUALIFIERS = re.compile(r"\d|\b(last|latest|this|current|recent|first|previous|when|while|with|without|against|before|after|"
+                        r"during|since|until|except|excluding|non-?zero|per|letzte\w*|diese[mnrs]?|aktuelle\w*|erste\w*|"
+                        r"vorige\w*|wenn|w[aä]hrend|mit|ohne|gegen|vor|nach|seit|bis|au[sß]er)\b", re.IGNORECASE)
+# Only a qualifier if it is not what is asked for ("how many sessions")
+SESSION = re.compile(r"\b(sessions?|evenings?|abende?n?|spieleabende?n?)\b", re.IGNORECASE)
+QUANTITY = re.compile(r"\b(how (many|much|often|high|low)|what|which|number of|count|total|"
+                      r"wie (viele?|oft|hoch|niedrig)|was|welche[rs]?|anzahl)\b|^\W*\w+(\W+\w+){0,3}\W*$", re.IGNORECASE)
+
+
+def _finals(data: Games) -> list[int]:
+    return [final_score(score, flag) for score, flag in data if score is not None]
+
+
+def _longest_win_streak(data: Games) -> int:
+    longest = current = 0
+    for final in _finals(data):
+        current = current + 1 if final == 0 else 0
+        longest = max(longest, current)
+    return longest
+
+
+def _round(value: float) -> str:
+    return f"{round(value, 2):g}"
+
+
+# (pattern, answer) pairs, the first pattern found in a question wins and its text is removed before looking for others
+METRICS: list[tuple[re.Pattern, _ty.Callable[[Games, _ty.Sequence[int]], str]]] = [
+    (re.compile(r"\b(longest|best|max(imum)?|l[aä]ngste)\b.*\b(win(ning)?\s*)?(streak|series|run|serie|s(ie|ei)gesserie)\b",
+                re.IGNORECASE),
+     lambda data, sessions: str(_longest_win_streak(data))),
+    (re.compile(r"\b(win\s*-?\s*(rate|ratio|percentage)|percent(age)? of (games )?won|"
+                r"(gewinn|sieg)\s*-?\s*(rate|quote))\b", re.IGNORECASE),
+     lambda data, sessions: f"{round(_finals(data).count(0) / len(_finals(data)) * 100) if _finals(data) else 0}%"),
+    (re.compile(r"\b(avg|average|mean|durchschnitt\w*|schnitt)\b", re.IGNORECASE),
+     lambda data, sessions: _round(sum(_finals(data)) / len(_finals(data))) if _finals(data) else "0"),
+    (re.compile(r"\b(highest|max(imum)?|largest|biggest|worst|most points|h[oö]chste\w*|gr[oö][sß]te\w*|schlechteste\w*)\b",
+                re.IGNORECASE),
+     lambda data, sessions: str(max(_finals(data), default=0))),
+    (re.compile(r"\b(lowest|min(imum)?|smallest|niedrigste\w*|kleinste\w*)\b", re.IGNORECASE),
+     lambda data, sessions: str(min(_finals(data), default=0))),
+    (re.compile(r"\b(flag(ged|s)?|hand (games|wins)|r(o|omm)e?[eé] ?hands?)\b", re.IGNORECASE),
+     lambda data, sessions: str(sum(1 for score, flag in data if score is not None and flag))),
+    (re.compile(r"\b(wins?|won|victories|siege|gewonnen|gewinnt?|gewinne)\b", re.IGNORECASE),
+     lambda data, sessions: str(_finals(data).count(0))),
+    (re.compile(r"\b(losses|lost|defeats|niederlagen|verloren)\b", re.IGNORECASE),
+     lambda data, sessions: str(sum(1 for final in _finals(data) if final != 0))),
+    (re.compile(r"\b(total|sum of|all)\b.*\bpoints\b|\b(gesamt|summe)\w*\b", re.IGNORECASE),
+     lambda data, sessions: str(sum(_finals(data)))),
+]
+# Only answered if nothing in METRICS matched, "how many games did they win" is about the wins
+COUNTS: list[tuple[re.Pattern, _ty.Callable[[Games, _ty.Sequence[int]], str]]] = [
+    (re.compile(r"\b(sessions|abende|spieleabende)\b", re.IGNORECASE),
+     lambda data, sessions: str(len(set(sessions)))),
+    (re.compile(r"\b(games|played|rounds|spiele|runden|gespielt)\b", re.IGNORECASE),
+     lambda data, sessions: str(len(_finals(data)))),
+]
+
+
+def _mentions(question: str, name: str) -> bool:
+    return re.search(rf"(?<!\w){re.escape(name)}(?!\w)", question, re.IGNORECASE) is not None
+
+
+def answer_locally(question: str, data: Games, sessions: _ty.Sequence[int],
+                   other_players: _ty.Iterable[str] = ()) -> str | None:
+    """
+    The answer to a question about exactly one supported number (highest/lowest/average final
+    score, wins, losses, win rate, flagged games, longest win streak, games, sessions, total points)
+    over all of the player's games. None for anything else, those are left to the model: questions
+    narrowed down by a QUALIFIERS word, a session or any of other_players (the names of the others).
+    """
+    if FREE_FORM.search(question) or QUALIFIERS.search(question) or not QUANTITY.search(question):
+        return None
+    if any(_mentions(question, name) for name in other_players):
+        return None
+    rest = question
+    matches: list[_ty.Callable[[Games, _ty.Sequence[int]], str]] = []
+    for patterns in (METRICS, COUNTS):
+        for pattern, answer in patterns:
+            match = pattern.search(rest)
+            if match:
+                matches.append(answer)
+                rest = rest[:match.start()] + " " + rest[match.end():]
+        if matches:
+            break  # COUNTS only if nothing in METRICS matched
+    if len(matches) != 1 or SESSION.search(rest):
+        return None  # Nothing we know, several things at once, or about a session
+    return matches[0](data, sessions)
@@ -1,25 +1,51 @@
 """TBA"""
-from flask import Flask, jsonify, g, Response, request, make_response
+from flask import Flask, jsonify, Response, request, make_response
+from prometheus_client import Counter, Histogram
 import requests
 import sqlite3
 import json
+import zlib
+import time
 import os
 
+from sqlite_pool import ConnectionManager
+from response_cache import ResponseCache
+from generation_queue import GenerationQueue, QueueFull
+from prompt_compaction import compact_history
+from local_answers import answer_locally
+from change_feed import ChangeFeed
+from profiling import REGISTRY, DEFAULT_BUCKETS, instrument, span, metrics_response
+import normalized
+
 import typing as _ty
 
 DB_NAME = "data.db"
 app = Flask(__name__)
+instrument(app)
+
+DB = ConnectionManager(DB_NAME)
+RESPONSE_CACHE = ResponseCache("responses.db")
+# At most 2 generations on the model host at once, 8 more may wait for up to 2 minutes, the rest get a 503
+OLLAMA_QUEUE = GenerationQueue(max_concurrent=2, max_queued=8, timeout=120.0)
+PROMPT_TOKEN_BUDGET = 1024  # Tokens the score history may take up in a prompt, longer histories get summarized
+
+OLLAMA_SECONDS = Histogram("romee_ollama_seconds", "Time of a generation, until its last token.", ("model", "mode"),
+                           buckets=DEFAULT_BUCKETS, registry=REGISTRY)
+OLLAMA_TOKENS = Counter("romee_ollama_tokens", "Tokens the model read (prompt) and generated (completion).",
+                        ("model", "kind"), registry=REGISTRY)
+OLLAMA_TOKENS_PER_SECOND = Histogram("romee_ollama_tokens_per_second", "Generation speed of the completion.",
+                                     ("model",), buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 200, 300),
+                                     registry=REGISTRY)
+# No model label, failed names are arbitrary
+OLLAMA_ERRORS = Counter("romee_ollama_errors", "Generations that failed.", registry=REGISTRY)
 
-def get_db():
-    if "db" not in g:
-        g.db = sqlite3.connect(DB_NAME)
-        g.db.row_factory = sqlite3.Row
-    return g.db
+def get_db() -> sqlite3.Connection:
+    """This thread's pooled read-only connection."""
+    return DB.reader()
 
 @app.teardown_appcontext
-def close_db(error):
-    db = g.pop("db", None)
-    if db: db.close()
+def release_db(error):
+    DB.release()
 
 def create_db(players: list[tuple[str, str]] | None = None, games: list[tuple[int | None, ...]] | None = None, hand_scores: dict[int, int] | None = None):
     good_players: list[tuple[str, str]] = players or [("Alice", "player1"), ("Bob", "player2"), ("Cara", "player3")]
@@ -41,6 +67,8 @@ def create_db(players: list[tuple[str, str]] | None = None, games: list[tuple[in
     c.execute("DROP TABLE IF EXISTS scores")
     c.execute("DROP TABLE IF EXISTS players")
     c.execute("DROP TABLE IF EXISTS hands")
+    c.execute("DROP TABLE IF EXISTS round_scores")
+    c.execute("DROP TABLE IF EXISTS rounds")
     c.execute("PRAGMA foreign_keys = ON;")
 
     c.execute("""
@@ -55,6 +83,7 @@ def create_db(players: list[tuple[str, str]] | None = None, games: list[tuple[in
     columns = ", ".join(f"{col} INTEGER DEFAULT NULL" for _, col in good_players)
     c.execute(f"CREATE TABLE scores (id INTEGER PRIMARY KEY AUTOINCREMENT, {columns})")
     c.execute("CREATE TABLE hands (scores_id INTEGER REFERENCES scores(id), flag INTEGER NOT NULL)")
+    c.execute(normalized.HANDS_INDEX)
 
     placeholders = ", ".join(["?"] * len(good_players))
     c.executemany(f"INSERT INTO scores ({', '.join([col for _, col in good_players])}) VALUES ({placeholders})", good_games)
@@ -63,22 +92,212 @@ def create_db(players: list[tuple[str, str]] | None = None, games: list[tuple[in
     conn.commit()
     conn.close()
 
+def get_schema_version(cursor: sqlite3.Cursor) -> str:
+    """Changes whenever a player or a scores column is added, renamed or removed."""
+    players = [tuple(row) for row in cursor.execute("SELECT * FROM players ORDER BY id").fetchall()]
+    if normalized.is_normalized(cursor):  # The columns it is served with, see table_query
+        columns = ["id"] + [row[2] for row in players]
+    else:
+        columns = [row["name"] for row in cursor.execute("PRAGMA table_info(scores)").fetchall()]
+    return f"{zlib.crc32(json.dumps([players, columns]).encode()):08x}"
+
+def get_data_version(cursor: sqlite3.Cursor) -> str:
+    """
+    Cheap version of the whole data set, used as the /get_data ETag.
+    Max ids and row counts move with every added or removed row, the schema version with every player change.
+    """
+    if normalized.is_normalized(cursor):
+        scores = cursor.execute("SELECT coalesce(MAX(id), 0), COUNT(*) FROM rounds").fetchone()
+        hands = cursor.execute("SELECT coalesce(SUM(hand_flag != 0), 0), (SELECT COUNT(*) FROM round_scores) FROM rounds").fetchone()
+    else:
+        scores = cursor.execute("SELECT coalesce(MAX(id), 0), COUNT(*) FROM scores").fetchone()
+        hands = cursor.execute("SELECT coalesce(MAX(rowid), 0), COUNT(*) FROM hands").fetchone()
+    return f"{get_schema_version(cursor)}-{scores[0]}.{scores[1]}-{hands[0]}.{hands[1]}"
+
+def get_tables(cursor: sqlite3.Cursor) -> list[str]:
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
+    return [row["name"] for row in cursor.fetchall()]
+
+def served_tables(cursor: sqlite3.Cursor) -> list[str]:
+    """The tables as clients know them, a normalized database is served as scores and hands (see table_query)."""
+    tables = get_tables(cursor)
+    if "rounds" in tables:
+        tables = [table for table in tables if table not in ("rounds", "round_scores")] + ["scores", "hands"]
+    return tables
+
+# Tables that only ever grow with the scores, keyed by the column holding the scores id
+DELTA_TABLES: dict[str, str] = {"scores": "id", "hands": "scores_id"}
+
+def table_query(cursor: sqlite3.Cursor, table: str, since: int | None = None) -> tuple[str, str, tuple]:
+    """(table, sql, params) of the rows of table, only those past the scores id since for DELTA_TABLES."""
+    if table in DELTA_TABLES and normalized.is_normalized(cursor):
+        if table == "scores":
+            return (table, *normalized.legacy_scores_query(cursor, since or 0))
+        return (table, *normalized.legacy_hands_query(since or 0))
+    if since is None:
+        return table, f"SELECT * FROM {table};", ()
+    return table, f"SELECT * FROM {table} WHERE {DELTA_TABLES[table]} > ?;", (since,)
+STREAM_BATCH_SIZE = 500  # Rows fetched from the cursor per serialized chunk
+
+def stream_tables(db: sqlite3.Connection, queries: list[tuple[str, str, tuple]], columnar: bool,
+                  header: dict[str, _ty.Any] | None = None) -> _ty.Iterator[str]:
+    """
+    Serialize {table: rows} as JSON text while the rows are fetched, one batch at a time.
+    Columnar tables are {"columns": [names], "rows": [[values], ...]} instead of a list of row objects.
+    With a header the tables are nested: {**header, "tables": {...}}.
+
+    The response outlives the request context (and get_db's connection), so db is owned
+    by the stream and closed once it is exhausted (get_data closes it with the response as well).
+    """
+    try:
+        yield from _stream_tables(db, queries, columnar, header)
+    finally:
+        db.close()
+
+def _stream_tables(db: sqlite3.Connection, queries: list[tuple[str, str, tuple]], columnar: bool,
+                   header: dict[str, _ty.Any] | None) -> _ty.Iterator[str]:
+    if header is not None:
+        yield "{" + "".join(f"{json.dumps(k)}: {json.dumps(v)}, " for k, v in header.items()) + '"tables": '
+    yield "{"
+    for n, (table, query, params) in enumerate(queries):
+        cursor = db.execute(query, params)
+        columns = [col[0] for col in cursor.description]
+        yield ("," if n else "") + json.dumps(table) + ": "
+        yield '{"columns": ' + json.dumps(columns) + ', "rows": [' if columnar else "["
+        sep = ""
+        while batch := cursor.fetchmany(STREAM_BATCH_SIZE):
+            if columnar:
+                yield sep + ",".join(json.dumps(tuple(row)) for row in batch)
+            else:
+                yield sep + ",".join(json.dumps(dict(zip(columns, row))) for row in batch)
+            sep = ","
+        yield "]}" if columnar else "]"
+    yield "}}" if header is not None else "}"
+
+def gzip_stream(chunks: _ty.Iterable[str], level: int = 6) -> _ty.Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def json_stream_response(chunks: _ty.Iterable[str], etag: str | None = None) -> Response:
+    """Stream the JSON chunks, gzip-compressed if the client accepts it."""
+    if request.accept_encodings["gzip"]:
+        resp = Response(gzip_stream(chunks), mimetype="application/json")
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = Response((chunk.encode("utf-8") for chunk in chunks), mimetype="application/json")
+    resp.headers["Vary"] = "Accept-Encoding"
+    if etag is not None:
+        resp.set_etag(etag, weak=True)
+    resp.status_code = 200
+    return resp
+
 @app.route("/get_data")
 def get_data() -> Response:
-    db = get_db()
-    cursor = db.cursor()  # Get all table names
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-    tables: list[str] = [row["name"] for row in cursor.fetchall()]
-    db_dict: dict[str, list[dict[str, _ty.Any]]] = {}  # Read each table into a dictionary
+    """
+    Without arguments every row of every table is returned as {table: rows}.
+
+    With ?since=<scores id>&schema=<schema version> only rows past the watermark are returned:
+        {"full": false, "schema": ..., "max_id": ..., "prefix_count": ..., "tables": {table: rows}}
+    prefix_count is the number of scores rows with id <= since and prefix_flags digests their hand flags
+    (see normalized.flags_prefix), so the client can detect rewritten history and flags set on old rounds.
+    If the schema changed (or ?full=1) all tables are sent in "tables" with "full": true.
+
+    The response is streamed while rows are read (gzip-compressed if accepted), ?layout=columnar
+    sends every table as {"columns": [names], "rows": [[values], ...]}.
+
+    The ETag is the data version (see get_data_version), a matching If-None-Match gets a 304:
+    nothing changed since the client's last sync, whatever it asked for.
+    """
+    # Dedicated connection for the stream, one read transaction keeps the header and the rows consistent
+    db = DB.connect(readonly=True)
+    try:
+        resp = data_response(db)
+    except BaseException:
+        db.close()
+        raise
+    resp.call_on_close(db.close)  # Even if the body is never read
+    return resp
+
+def data_response(db: sqlite3.Connection) -> Response:
+    """The /get_data response read from db, its body streams from db until it is closed."""
+    db.execute("BEGIN")
+    cursor = db.cursor()
+    with span("db"):
+        version = get_data_version(cursor)
+    if request.if_none_match.contains_weak(version):
+        resp = make_response("", 304)
+        resp.set_etag(version, weak=True)
+        return resp
+
+    tables: list[str] = served_tables(cursor)  # Get all table names
+    columnar = request.args.get("layout") == "columnar"
+    since = request.args.get("since", type=int)
+    if since is None:
+        queries = [table_query(cursor, table) for table in tables]
+        return json_stream_response(stream_tables(db, queries, columnar), version)
+
+    with span("db"):
+        schema = get_schema_version(cursor)
+        max_id, prefix_count = cursor.execute(f"SELECT coalesce(MAX(id), 0), coalesce(SUM(id <= ?), 0) "
+                                              f"FROM {normalized.rounds_table(cursor)}", (since,)).fetchone()
+        prefix_flags = normalized.flags_prefix(cursor, since)
+    full = request.args.get("full", type=int) == 1 or request.args.get("schema") != schema
+    queries = []
     for table in tables:
-        cursor.execute(f"SELECT * FROM {table};")
-        rows = cursor.fetchall()
-        db_dict[table] = [dict(row) for row in rows]
-    resp = jsonify(db_dict)
-    resp.status_code = 200
+        if full:
+            queries.append(table_query(cursor, table))
+        elif table in DELTA_TABLES:
+            queries.append(table_query(cursor, table, since))
+        # Other tables are unchanged, the schema version covers them
+    header = {"full": full, "schema": schema, "since": since, "max_id": max_id, "prefix_count": prefix_count,
+              "prefix_flags": prefix_flags}
+    return json_stream_response(stream_tables(db, queries, columnar, header), version)
+
+def change_snapshot(cursor: sqlite3.Cursor) -> tuple[str, int]:
+    max_id = cursor.execute(f"SELECT coalesce(MAX(id), 0) FROM {normalized.rounds_table(cursor)}").fetchone()[0]
+    return get_data_version(cursor), max_id
+
+CHANGE_FEED = ChangeFeed(lambda: DB.connect(readonly=True), change_snapshot)
+MAX_CHANGES_TIMEOUT = 60.0
+
+@app.route("/changes")
+def changes() -> Response:
+    """
+    Long-poll for changes: ?since=<data version> (the /get_data ETag) is held until the data version
+    differs from it, or for ?timeout= seconds (default 30, at most 60). Returns
+        {"changed": bool, "version": ..., "from_id": ..., "max_id": ...}
+    The new scores rows are from_id < id <= max_id, from_id is null if since is unknown or too old.
+    Without since the current version is returned right away.
+    """
+    since = request.args.get("since")
+    timeout = min(max(request.args.get("timeout", 30.0, type=float), 0.0), MAX_CHANGES_TIMEOUT)
+    resp = jsonify(CHANGE_FEED.wait(since, timeout if since is not None else 0.0))
+    resp.headers["Cache-Control"] = "no-store"
     return resp
 
 
+OLLAMA_URL = "http://localhost:11434/api/generate"
+# One pooled session, requests to the model reuse their keep-alive connections
+OLLAMA_SESSION = requests.Session()
+OLLAMA_SESSION.mount("http://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+def record_generation(model: str, mode: str, seconds: float, stats: dict, chunks: int = 0):
+    """
+    Time and tokens of one generation. stats is Ollama's final message, its eval_count and eval_duration (ns)
+    give the completion speed, without them the chunks received over the whole time are counted instead.
+    """
+    OLLAMA_SECONDS.labels(model, mode).observe(seconds)
+    completion = stats.get("eval_count") or chunks
+    OLLAMA_TOKENS.labels(model, "prompt").inc(stats.get("prompt_eval_count") or 0)
+    OLLAMA_TOKENS.labels(model, "completion").inc(completion)
+    duration = stats["eval_duration"] / 1e9 if stats.get("eval_duration") else seconds
+    if completion and duration > 0:
+        OLLAMA_TOKENS_PER_SECOND.labels(model).observe(completion / duration)
+
 def query_ollama(model: str, prompt: str, stream: bool = False) -> str:
     """
     Query a local Ollama model with a given prompt.
@@ -91,7 +310,7 @@ def query_ollama(model: str, prompt: str, stream: bool = False) -> str:
     Returns:
         str: The model's response.
     """
-    url = "http://localhost:11434/api/generate"
+    url = OLLAMA_URL
     payload = {
         "model": model,
         "prompt": prompt,
@@ -99,54 +318,175 @@ def query_ollama(model: str, prompt: str, stream: bool = False) -> str:
     }
     print(payload)
 
+    start = time.perf_counter()
     try:
-        response = requests.post(url, json=payload, stream=stream)
-        response.raise_for_status()
+        with span("ollama"):
+            response = OLLAMA_SESSION.post(url, json=payload, stream=stream)
+            response.raise_for_status()
 
-        if stream:
-            # Streamed output (generates chunks)
-            output = ""
-            for line in response.iter_lines():
-                if line:
-                    chunk = line.decode("utf-8")
-                    # The response comes as JSON lines
-                    data = json.loads(chunk)
-                    output += data.get("response", "")
-            return output
-        else:
-            # Non-streamed full response
-            return response.json().get("response", "")
+            if stream:
+                # Streamed output (generates chunks)
+                output = ""
+                data, chunks = {}, 0
+                for line in response.iter_lines():
+                    if line:
+                        chunk = line.decode("utf-8")
+                        # The response comes as JSON lines
+                        data = json.loads(chunk)
+                        output += data.get("response", "")
+                        chunks += 1
+                record_generation(model, "stream", time.perf_counter() - start, data, chunks)
+                return output
+            else:
+                # Non-streamed full response
+                data = response.json()
+                record_generation(model, "full", time.perf_counter() - start, data)
+                return data.get("response", "")
     except requests.exceptions.HTTPError as e:
+        OLLAMA_ERRORS.inc()
         print("Full response:", e.response.text)
     except requests.exceptions.RequestException as e:
-        print(e.response.text)
+        OLLAMA_ERRORS.inc()
+        print(e.response.text if e.response is not None else e)  # No response if the host could not be reached
         return f"Error contacting Ollama: {e}"
 
+def stream_ollama(model: str, prompt: str) -> _ty.Iterator[str]:
+    """Yield the response of the model chunk by chunk, while it is generated (raises requests exceptions)."""
+    payload = {"model": model, "prompt": prompt, "stream": True}
+    start = time.perf_counter()
+    chunks = 0
+    try:
+        with OLLAMA_SESSION.post(OLLAMA_URL, json=payload, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    data = json.loads(line)  # The response comes as JSON lines
+                    if data.get("response"):
+                        chunks += 1
+                        yield data["response"]
+                    if data.get("done"):
+                        record_generation(model, "stream", time.perf_counter() - start, data, chunks)
+                        break
+    except requests.exceptions.RequestException:
+        OLLAMA_ERRORS.inc()
+        raise
+
+class GenerationFailed(Exception):
+    """The model host could not be reached or answered with an error."""
+
+def cached_query_ollama(model: str, prompt: str, data_version: str, regenerate: bool = False) -> tuple[str, bool]:
+    """
+    query_ollama through RESPONSE_CACHE and OLLAMA_QUEUE, returns (response, if it was cached).
+    Concurrent identical prompts share one generation. Errors are never cached, raises QueueFull or GenerationFailed.
+    """
+    key = RESPONSE_CACHE.key(model, prompt, data_version)
+    if not regenerate:
+        response = RESPONSE_CACHE.get(key)
+        if response is not None:
+            return response, True
+
+    def generate() -> str | None:
+        response = query_ollama(model, prompt, False)
+        if response is None or response.startswith("Error contacting Ollama"):
+            raise GenerationFailed(response or "Error contacting Ollama: the model answered with an error")
+        RESPONSE_CACHE.put(key, model, response)  # Before the flight ends, so no one starts it again in between
+        return response
+    response = OLLAMA_QUEUE.run(key, generate)
+    if response is None:  # Shared a flight that ended without a response
+        raise GenerationFailed("Error contacting Ollama: the identical generation ended without a response")
+    return response, False
+
+def wants_regenerate() -> bool:
+    """?regenerate=1 asks for a fresh generation instead of the cached one."""
+    return request.args.get("regenerate", "").lower() in ("1", "true", "yes")
+
+@app.route("/metrics")
+def metrics() -> Response:
+    return metrics_response()
+
+@app.route("/response_cache")
+def response_cache():
+    return jsonify(RESPONSE_CACHE.info())
+
+@app.route("/ollama_queue")
+def ollama_queue():
+    return jsonify(OLLAMA_QUEUE.info())
+
+@app.errorhandler(QueueFull)
+def model_busy(e: QueueFull) -> Response:
+    resp = jsonify({"error": f"The model is busy, try again later ({e})"})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = "10"
+    return with_cors(resp)
+
+@app.errorhandler(GenerationFailed)
+def generation_failed(e: GenerationFailed) -> Response:
+    resp = jsonify({"error": str(e)})
+    resp.status_code = 502
+    return with_cors(resp)
+
 # [(1, 0), (2, 0), (3, 0), (4, 0), (5, 0), (6, 0), (7, 0), (9, 0), (10, 0), (11, 0), (12, 0), (13, 0), (15, 0), (16, 0), (17, 0), (18, 0), (19, 0), (20, 0), (21, 0), (22, 0), (24, 0), (25, 0), (26, 0), (27, 0), (28, 0), (29, 0), (30, 0), (31, 0), (32, 0), (33, 0), (34, 0), (35, 0), (36, 0), (38, 1), (39, 0), (40, 1), (41, 0), (43, 0), (44, 0), (45, 0), (46, 0), (47, 0), (49, 1), (50, 0), (51, 0), (53, 0), (54, 0), (55, 0), (56, 0), (58, 0), (59, 0), (60, 0), (61, 0), (62, 0), (63, 0), (65, 0), (66, 0), (67, 0), (68, 0), (69, 1), (70, 0), (71, 0), (72, 1), (73, 0), (74, 1)]
-@app.route("/player_quote/<string:model>/<string:player_name>", methods=["GET", "OPTIONS"])
-def player_quote(model: str, player_name: str) -> Response:
+def with_cors(resp: Response) -> Response:
+    origin = request.headers.get("Origin")
+    if origin:
+        resp.headers["Access-Control-Allow-Origin"] = origin
+    #     resp.headers["Access-Control-Allow-Credentials"] = "true"
+        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS"
+    return resp
+
+def preflight() -> tuple[Response, int]:
     # For preflight (OPTIONS) requests
-    if request.method == "OPTIONS":
-        resp = make_response()
-        origin = request.headers.get("Origin")
-        if origin:
-            resp.headers["Access-Control-Allow-Origin"] = origin
-            # resp.headers["Access-Control-Allow-Credentials"] = "true"
-            resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
-            resp.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS"
-        return resp, 204
-    db = get_db()
-    cursor = db.cursor()
-    try:
-        cursor.execute("SELECT colname FROM players WHERE name = ?", (player_name,))
-        player_column: str = cursor.fetchone()[0]
-    except sqlite3.OperationalError:
-        resp = jsonify({"error": "Bad playername"})
-        resp.status_code = 308
-        return resp
-    cursor.execute(f"SELECT s.{player_column}, h.flag FROM scores s JOIN hands h ON s.id = h.scores_id WHERE 1 = 1")
-    data: tuple[tuple[int, int], ...] = tuple((x[0], x[1]) for x in cursor.fetchall() if x[0] != 1)
-    data_str: str = ",".join(f"{x[0]}{'f' if x[1] else ''}" for x in data)
+    resp = make_response()
+    origin = request.headers.get("Origin")
+    if origin:
+        resp.headers["Access-Control-Allow-Origin"] = origin
+        # resp.headers["Access-Control-Allow-Credentials"] = "true"
+        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+        resp.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS"
+    return resp, 204
+
+def bad_playername() -> Response:
+    resp = jsonify({"error": "Bad playername"})
+    resp.status_code = 308
+    return resp
+
+PlayerGames = tuple[tuple[tuple[int, int], ...], tuple[int, ...]]
+
+def player_data(cursor: sqlite3.Cursor, player_name: str) -> PlayerGames:
+    """
+    (score, flag) of every game the player was present in, and the (1-based) session of each.
+    Raises sqlite3.OperationalError for unknown players.
+    """
+    with span("db"):
+        return _player_data(cursor, player_name)
+
+def _player_data(cursor: sqlite3.Cursor, player_name: str) -> PlayerGames:
+    if normalized.is_normalized(cursor):
+        row = cursor.execute("SELECT id FROM players WHERE name = ?", (player_name,)).fetchone()
+        if row is None:
+            raise sqlite3.OperationalError(f"no such player: {player_name}")
+        rows = [x for x in normalized.player_rounds(cursor, row[0]) if x[0] != 1]
+        return tuple((x[0], x[1]) for x in rows), tuple(x[2] for x in rows)
+    cursor.execute("SELECT colname FROM players WHERE name = ?", (player_name,))
+    player_column: str = cursor.fetchone()[0]
+    columns = [row[0] for row in cursor.execute("SELECT colname FROM players").fetchall()]
+    separator = " AND ".join(f"{col} IS NULL" for col in columns)  # A row without any scores ends a session
+    cursor.execute(f"""
+        SELECT s.{player_column}, coalesce(h.flag, 0), s.session
+        FROM (SELECT *, 1 + SUM({separator}) OVER (ORDER BY id) AS session FROM scores) s
+        LEFT JOIN (SELECT scores_id, MAX(flag) AS flag FROM hands GROUP BY scores_id) h ON s.id = h.scores_id
+        ORDER BY s.id
+    """)  # Only flagged games have a hands row
+    rows = [x for x in cursor.fetchall() if x[0] not in (None, 1)]  # Absent, or a session separator
+    return tuple((x[0], x[1]) for x in rows), tuple(x[2] for x in rows)
+
+def other_player_names(cursor: sqlite3.Cursor, player_name: str) -> list[str]:
+    return [row[0] for row in cursor.execute("SELECT name FROM players WHERE name != ?", (player_name,)).fetchall()]
+
+def quote_prompt(player_name: str, games: PlayerGames, budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    data, sessions = games
+    data_str: str = compact_history(data, sessions, budget)
 
     # Calculate win rate
     total_games = len(data)
@@ -166,43 +506,10 @@ def player_quote(model: str, player_name: str) -> Response:
         "Integrate the name of the player in a funny way if possible. This is a card game not Poker data do not mention this fact. "
     )
     model_request += f"Here is the data: {data_str}"
-    response: str = query_ollama(model, model_request, False).replace("soccer", "")
-    resp = jsonify({"response": response})
-    resp.status_code = 200
-
-    origin = request.headers.get("Origin")
-    if origin:
-        resp.headers["Access-Control-Allow-Origin"] = origin
-    #     resp.headers["Access-Control-Allow-Credentials"] = "true"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
-        resp.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS"
-
-    return resp
+    return model_request
 
-@app.route("/player_info/<string:model>/<string:player_name>/<string:question>", methods=["GET", "OPTIONS"])
-def player_info(model: str, player_name: str, question: str) -> Response:
-    # For preflight (OPTIONS) requests
-    if request.method == "OPTIONS":
-        resp = make_response()
-        origin = request.headers.get("Origin")
-        if origin:
-            resp.headers["Access-Control-Allow-Origin"] = origin
-            # resp.headers["Access-Control-Allow-Credentials"] = "true"
-            resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
-            resp.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS"
-        return resp, 204
-    db = get_db()
-    cursor = db.cursor()
-    try:
-        cursor.execute("SELECT colname FROM players WHERE name = ?", (player_name,))
-        player_column: str = cursor.fetchone()[0]
-    except sqlite3.OperationalError:
-        resp = jsonify({"error": "Bad playername"})
-        resp.status_code = 308
-        return resp
-    cursor.execute(f"SELECT s.{player_column}, h.flag FROM scores s JOIN hands h ON s.id = h.scores_id WHERE 1 = 1")
-    data: tuple[tuple[int, int], ...] = tuple((x[0], x[1]) for x in cursor.fetchall() if x[0] != 1)
-    data_str: str = ",".join(f"{x[0]}{'f' if x[1] else ''}" for x in data)
+def info_prompt(question: str, games: PlayerGames, budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    data_str: str = compact_history(*games, budget)
     model_request = ("The data format is: score followed by 'f' if flagged. 0 = win, higher is worse. "
                "Flag doubles the score. Analyze the data and answer the following question. "
                "Respond clearly and concisely.")
@@ -215,23 +522,166 @@ def player_info(model: str, player_name: str, question: str) -> Response:
         f"Data: {data_str}\n"
         f"Question: {question}"
     )
-    model_request += f"Here is the data: {data_str} "
     model_request += f"Please answer following question: {question}"
-    response: str = query_ollama(model, model_request, False)
-    resp = jsonify({"response": response})
+    return model_request
+
+def sse_event(data: dict, event: str | None = None) -> str:
+    return (f"event: {event}\n" if event else "") + f"data: {json.dumps(data)}\n\n"
+
+def sse_response(model: str, prompt: str, data_version: str, regenerate: bool,
+                 clean: _ty.Callable[[str], str] = lambda text: text) -> Response:
+    """
+    Relay the generation as Server-Sent Events: one {"token"} message per chunk, then a
+    "done" event with the whole (cleaned) response, or an "error" event.
+
+    A cached response is sent as a single token. A request for a prompt that is already being
+    generated waits for that generation and gets it the same way. Otherwise the generation
+    takes a slot of OLLAMA_QUEUE before the response starts (raises QueueFull), and is cached once complete.
+    """
+    key = RESPONSE_CACHE.key(model, prompt, data_version)
+    cached = None if regenerate else RESPONSE_CACHE.get(key)
+    flight, leader = OLLAMA_QUEUE.lead(key) if cached is None else (None, False)
+    if leader:
+        try:
+            OLLAMA_QUEUE.acquire()
+        except QueueFull as e:
+            OLLAMA_QUEUE.finish(key, flight, error=e)
+            raise
+    finished = False
+
+    def finish(result: str | None = None, error: BaseException | None = None):
+        # Runs when the stream ends, or when the response is closed without being read to the end
+        nonlocal finished
+        if leader and not finished:
+            finished = True
+            if result is None and error is None:
+                error = GenerationFailed("The generation was cancelled, its client disconnected")
+            OLLAMA_QUEUE.finish(key, flight, result, error)
+            OLLAMA_QUEUE.release()
+
+    def whole(response: str) -> _ty.Iterator[str]:
+        yield sse_event({"token": clean(response)})
+        yield sse_event({"response": clean(response), "cached": True}, "done")
+
+    def events() -> _ty.Iterator[str]:
+        if cached is not None:
+            yield from whole(cached)
+            return
+        if not leader:
+            yield ": waiting for the identical generation\n\n"
+            try:
+                response = OLLAMA_QUEUE.wait(flight)
+            except (QueueFull, GenerationFailed) as e:
+                response, error = None, str(e)
+            else:
+                error = "Error contacting Ollama"
+            if response is None:
+                yield sse_event({"error": error}, "error")
+            else:
+                yield from whole(response)
+            return
+        output = ""
+        try:
+            for token in stream_ollama(model, prompt):
+                output += token
+                yield sse_event({"token": clean(token)})
+        except requests.exceptions.RequestException as e:
+            error = GenerationFailed(f"Error contacting Ollama: {e}")
+            finish(error=error)
+            yield sse_event({"error": str(error)}, "error")
+            return
+        RESPONSE_CACHE.put(key, model, output)
+        finish(output)
+        yield sse_event({"response": clean(output), "cached": False}, "done")
+
+    resp = Response(events(), mimetype="text/event-stream")
+    resp.call_on_close(finish)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # Keep reverse proxies from holding back the tokens
+    return with_cors(resp)
+
+@app.route("/player_quote/<string:model>/<string:player_name>", methods=["GET", "OPTIONS"])
+def player_quote(model: str, player_name: str) -> Response:
+    if request.method == "OPTIONS":
+        return preflight()
+    cursor = get_db().cursor()
+    try:
+        games = player_data(cursor, player_name)
+    except sqlite3.OperationalError:
+        return bad_playername()
+    response, cached = cached_query_ollama(model, quote_prompt(player_name, games), get_data_version(cursor), wants_regenerate())
+    resp = jsonify({"response": response.replace("soccer", "")})
+    resp.headers["X-Cache"] = "HIT" if cached else "MISS"
     resp.status_code = 200
+    return with_cors(resp)
 
-    origin = request.headers.get("Origin")
-    if origin:
-        resp.headers["Access-Control-Allow-Origin"] = origin
-    #     resp.headers["Access-Control-Allow-Credentials"] = "true"
-        resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
-        resp.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS"
+@app.route("/player_quote_stream/<string:model>/<string:player_name>", methods=["GET", "OPTIONS"])
+def player_quote_stream(model: str, player_name: str) -> Response:
+    if request.method == "OPTIONS":
+        return preflight()
+    cursor = get_db().cursor()
+    try:
+        games = player_data(cursor, player_name)
+    except sqlite3.OperationalError:
+        return bad_playername()
+    return sse_response(model, quote_prompt(player_name, games), get_data_version(cursor), wants_regenerate(),
+                        lambda text: text.replace("soccer", ""))
 
-    return resp
+@app.route("/player_info/<string:model>/<string:player_name>/<string:question>", methods=["GET", "OPTIONS"])
+def player_info(model: str, player_name: str, question: str) -> Response:
+    if request.method == "OPTIONS":
+        return preflight()
+    cursor = get_db().cursor()
+    try:
+        games = player_data(cursor, player_name)
+    except sqlite3.OperationalError:
+        return bad_playername()
+    local = answer_locally(question, *games, other_player_names(cursor, player_name))
+    if local is not None:  # Simple numeric question, no need for the model
+        resp = jsonify({"response": local})
+        resp.headers["X-Answer-Source"] = "local"
+        return with_cors(resp)
+    response, cached = cached_query_ollama(model, info_prompt(question, games), get_data_version(cursor), wants_regenerate())
+    resp = jsonify({"response": response})
+    resp.headers["X-Cache"] = "HIT" if cached else "MISS"
+    resp.headers["X-Answer-Source"] = "model"
+    resp.status_code = 200
+    return with_cors(resp)
 
+@app.route("/player_info_stream/<string:model>/<string:player_name>/<string:question>", methods=["GET", "OPTIONS"])
+def player_info_stream(model: str, player_name: str, question: str) -> Response:
+    if request.method == "OPTIONS":
+        return preflight()
+    cursor = get_db().cursor()
+    try:
+        games = player_data(cursor, player_name)
+    except sqlite3.OperationalError:
+        return bad_playername()
+    local = answer_locally(question, *games, other_player_names(cursor, player_name))
+    if local is not None:
+        resp = Response([sse_event({"token": local}), sse_event({"response": local, "cached": False}, "done")],
+                        mimetype="text/event-stream")
+        resp.headers["X-Answer-Source"] = "local"
+        return with_cors(resp)
+    return sse_response(model, info_prompt(question, games), get_data_version(cursor), wants_regenerate())
 
-if __name__ == "__main__":
+def create_app() -> Flask:
+    """
+    The app, ready to serve: the database exists and its pages are read once.
+    A pre-forking server calls it once before forking (see gunicorn.conf.py).
+    """
     if not os.path.exists(DB_NAME):
         create_db()
+    with sqlite3.connect(DB_NAME) as conn:
+        normalized.ensure_hands_index(conn.cursor())
+    db = DB.reader()
+    get_data_version(db.cursor())  # Reads the tables into the OS page cache the workers share
+    db.rollback()
+    DB.close_all()  # SQLite connections must not be carried over into forked processes
+    return app
+
+
+if __name__ == "__main__":  # Development server, see gunicorn.conf.py for production
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":  # Only in the reloader's serving process
+        create_app()
     app.run(port=8080, host="0.0.0.0", debug=True)
@@ -0,0 +1,169 @@
+"""Optional normalized storage of the rounds: one rounds row per round and one round_scores row per score"""
+import sqlite3
+
+import typing as _ty
+
+# Rounds keep the ids of the scores rows they were migrated from. A round without any scores is a
+# session separator of the scores table, kept so the ids (and the end of the last session) round-trip.
+SCHEMA: list[str] = [
+    """CREATE TABLE IF NOT EXISTS rounds (
+        id INTEGER PRIMARY KEY,
+        session_id INTEGER NOT NULL,
+        hand_flag INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS rounds_session ON rounds (session_id)",
+    """CREATE TABLE IF NOT EXISTS round_scores (
+        round_id INTEGER NOT NULL REFERENCES rounds(id) ON DELETE CASCADE,
+        player_id INTEGER NOT NULL REFERENCES players(id),
+        score INTEGER NOT NULL,
+        PRIMARY KEY (round_id, player_id)
+    ) WITHOUT ROWID""",
+    # Covers the per-player scans, they are index range reads that never touch the table
+    "CREATE INDEX IF NOT EXISTS round_scores_player ON round_scores (player_id, round_id, score)",
+]
+HANDS_INDEX = "CREATE INDEX IF NOT EXISTS hands_scores_id ON hands (scores_id)"
+MIGRATE_BATCH_SIZE = 1000
+
+
+def is_normalized(cursor: sqlite3.Cursor) -> bool:
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rounds'").fetchone() is not None
+
+
+def rounds_table(cursor: sqlite3.Cursor) -> str:
+    """The table holding one row per round (separators included) with an 'id' column: rounds or scores."""
+    return "rounds" if is_normalized(cursor) else "scores"
+
+
+def ensure_hands_index(cursor: sqlite3.Cursor):
+    """Index the scores_id every query joins hands on, for databases created before it existed."""
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hands'").fetchone() is not None:
+        cursor.execute(HANDS_INDEX)
+
+
+def create_tables(cursor: sqlite3.Cursor):
+    for sql in SCHEMA:
+        cursor.execute(sql)
+
+
+def add_player(cursor: sqlite3.Cursor, name: str) -> int:
+    """A single INSERT, no table has to be altered or rebuilt. Returns the new player id."""
+    cursor.execute("INSERT INTO players (name, colname) SELECT ?, 'player' || (coalesce(MAX(id), 0) + 1) FROM players",
+                   (name,))
+    return cursor.lastrowid
+
+
+def _next_session(cursor: sqlite3.Cursor) -> int:
+    """Session of the next appended round: the last one's, or a new one if the last round was a separator."""
+    row = cursor.execute("""
+        SELECT session_id, NOT EXISTS (SELECT 1 FROM round_scores WHERE round_id = r.id)
+        FROM rounds r ORDER BY id DESC LIMIT 1
+    """).fetchone()
+    if row is None:
+        return 1
+    return row[0] + 1 if row[1] else row[0]
+
+
+def append_legacy_rows(cursor: sqlite3.Cursor, player_ids: list[int],
+                       rows: _ty.Iterable[_ty.Sequence[int | None]]) -> int:
+    """
+    Append rows in the scores layout, (id, score_1, ..., score_n, flag) with the scores in
+    player_ids order and None for absent players. Ids have to come after the existing rounds.
+    Returns the number of rows written.
+    """
+    session = _next_session(cursor)
+    rounds: list[tuple[int, int, int]] = []
+    scores: list[tuple[int, int, int]] = []
+    for row in rows:
+        round_id, values, flag = row[0], row[1:-1], row[-1]
+        rounds.append((round_id, session, flag or 0))
+        present = [(round_id, player_id, value) for player_id, value in zip(player_ids, values) if value is not None]
+        scores.extend(present)
+        if not present:  # Separator, the next round starts a new session
+            session += 1
+    cursor.executemany("INSERT OR REPLACE INTO rounds (id, session_id, hand_flag) VALUES (?, ?, ?)", rounds)
+    cursor.executemany("INSERT OR REPLACE INTO round_scores (round_id, player_id, score) VALUES (?, ?, ?)", scores)
+    return len(rounds)
+
+
+def migrate(db: sqlite3.Connection, batch_size: int = MIGRATE_BATCH_SIZE, drop_legacy: bool = True) -> int:
+    """
+    Stream the scores and hands tables into rounds and round_scores, batch_size rows at a time.
+    Runs in one transaction, drop_legacy removes the old tables afterwards. Returns the number of rounds.
+    """
+    write = db.cursor()
+    write.execute("BEGIN IMMEDIATE")
+    try:
+        write.execute(HANDS_INDEX)
+        for table in ("round_scores", "rounds"):
+            write.execute(f"DROP TABLE IF EXISTS {table}")
+        create_tables(write)
+        players = write.execute("SELECT id, colname FROM players ORDER BY id").fetchall()
+        player_ids = [row[0] for row in players]
+
+        read = db.cursor()
+        read.execute(f"""
+            SELECT s.id, {''.join(f's.{row[1]}, ' for row in players)}
+                   (SELECT MAX(flag) FROM hands h WHERE h.scores_id = s.id)
+            FROM scores s ORDER BY s.id
+        """)
+        migrated = 0
+        while batch := read.fetchmany(batch_size):
+            migrated += append_legacy_rows(write, player_ids, batch)
+
+        if drop_legacy:
+            write.execute("DROP TABLE hands")
+            write.execute("DROP TABLE scores")
+    except BaseException:
+        db.rollback()
+        raise
+    db.commit()
+    return migrated
+
+
+def flags_prefix(cursor: sqlite3.Cursor, since_id: int) -> list[int]:
+    """
+    [count, flag total, id total] of the flagged rounds with id <= since_id, in either schema.
+    Moves when a flag of one of those rounds is added, removed or changed.
+    """
+    if is_normalized(cursor):
+        flagged = "SELECT id, hand_flag AS flag FROM rounds WHERE id <= ? AND hand_flag != 0"
+    else:  # Several hands rows of one round count once, like in rounds.hand_flag
+        flagged = ("SELECT scores_id AS id, MAX(flag) AS flag FROM hands WHERE scores_id <= ? "
+                   "GROUP BY scores_id HAVING MAX(flag) != 0")
+    return list(cursor.execute(f"SELECT COUNT(*), coalesce(SUM(flag), 0), coalesce(SUM(id), 0) FROM ({flagged})",
+                               (since_id,)).fetchone())
+
+
+def legacy_scores_query(cursor: sqlite3.Cursor, since_id: int = 0,
+                        with_flag: bool = False) -> tuple[str, tuple[int, ...]]:
+    """
+    (sql, params) reading the rounds past since_id in the layout of the scores table,
+    id and one column per player (players.colname), plus the hand flag with with_flag.
+    """
+    players = cursor.execute("SELECT id, colname FROM players ORDER BY id").fetchall()
+    columns = "".join(f", MAX(CASE WHEN rs.player_id = ? THEN rs.score END) AS {row[1]}" for row in players)
+    sql = f"""
+        SELECT r.id{columns}{', r.hand_flag AS flag' if with_flag else ''}
+        FROM rounds r
+        LEFT JOIN round_scores rs ON rs.round_id = r.id
+        WHERE r.id > ?
+        GROUP BY r.id
+        ORDER BY r.id
+    """
+    return sql, (*(row[0] for row in players), since_id)
+
+
+def legacy_hands_query(since_id: int = 0) -> tuple[str, tuple[int, ...]]:
+    """(sql, params) reading the flagged rounds past since_id in the layout of the hands table."""
+    return "SELECT id AS scores_id, hand_flag AS flag FROM rounds WHERE hand_flag != 0 AND id > ? ORDER BY id", (since_id,)
+
+
+def player_rounds(cursor: sqlite3.Cursor, player_id: int) -> list[tuple[int, int, int]]:
+    """(score, hand flag, session id) of every round the player was present in, an index range read."""
+    return cursor.execute("""
+        SELECT rs.score, r.hand_flag, r.session_id
+        FROM round_scores rs
+        JOIN rounds r ON r.id = rs.round_id
+        WHERE rs.player_id = ?
+        ORDER BY rs.round_id
+    """, (player_id,)).fetchall()
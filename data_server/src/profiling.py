@@ -0,0 +1,75 @@
+"""Request and stage timings, sent as Server-Timing headers and exposed for Prometheus (see prometheus_client)"""
+from contextlib import contextmanager
+import time
+
+from flask import Flask, Response, request, g, has_request_context, template_rendered, before_render_template
+from prometheus_client import CollectorRegistry, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+import typing as _ty
+
+# Seconds, from a cached page (well below a millisecond) to a model generation
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+REGISTRY = CollectorRegistry()  # The metrics of this process, rendered together for /metrics
+REQUEST_SECONDS = Histogram("romee_request_seconds", "Time until the response is returned by the view, per route.",
+                            ("method", "route", "status"), buckets=DEFAULT_BUCKETS, registry=REGISTRY)
+SPAN_SECONDS = Histogram("romee_span_seconds", "Time spent in one stage of a request (see Server-Timing).",
+                         ("span",), buckets=DEFAULT_BUCKETS, registry=REGISTRY)
+
+
+def add_server_timing(name: str, seconds: float):
+    """Count seconds toward the Server-Timing entry name of the current request, if there is one."""
+    if has_request_context() and "server_timing" in g:
+        g.server_timing[name] = g.server_timing.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name: str) -> _ty.Iterator[None]:
+    """Time the block as the stage name: in SPAN_SECONDS and in the request's Server-Timing header."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        SPAN_SECONDS.labels(name).observe(seconds)
+        add_server_timing(name, seconds)
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(REGISTRY), content_type=CONTENT_TYPE_LATEST, headers={"Cache-Control": "no-store"})
+
+
+def instrument(app: Flask):
+    """
+    Time every request of app into REQUEST_SECONDS (labelled by its route rule, not its path) and send the
+    spans it went through as a Server-Timing header, with the total as "app". Template rendering is the "render" span.
+    Streamed bodies are sent after the view returns, only the time until then is measured.
+    """
+    @app.before_request
+    def start_timing():
+        g.request_start = time.perf_counter()
+        g.server_timing = {}
+
+    @app.after_request
+    def finish_timing(resp: Response) -> Response:
+        if "request_start" not in g:  # Failed before start_timing ran
+            return resp
+        seconds = time.perf_counter() - g.request_start
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        REQUEST_SECONDS.labels(request.method, route, resp.status_code).observe(seconds)
+        timings = [*g.server_timing.items(), ("app", seconds)]
+        resp.headers["Server-Timing"] = ", ".join(f"{name};dur={duration * 1000:.3f}" for name, duration in timings)
+        return resp
+
+    def render_started(sender, template, context, **extra):
+        g.render_start = time.perf_counter()
+
+    def render_finished(sender, template, context, **extra):
+        start = g.pop("render_start", None)
+        if start is not None:
+            seconds = time.perf_counter() - start
+            SPAN_SECONDS.labels("render").observe(seconds)
+            add_server_timing("render", seconds)
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
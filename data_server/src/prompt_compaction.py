@@ -0,0 +1,106 @@
+"""Token-budgeted summaries of a player's score history, for the model prompts"""
+from collections import Counter
+import re
+
+import typing as _ty
+
+# Rough upper bound of what tokenizers make of score lists: every digit, word and punctuation mark is one token
+TOKEN_PATTERN = re.compile(r"\d|[^\W\d_]+|[^\w\s]")
+HISTOGRAM_BUCKETS: list[tuple[int, int]] = [(0, 0), (2, 8), (9, 20), (21, 40), (41, 80), (81, 10 ** 9)]
+
+Games = _ty.Sequence[tuple[int | None, int]]  # (score, flag) of every game, the score is None if absent
+
+
+def estimate_tokens(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def format_games(data: Games) -> str:
+    """The raw 'score' / 'scoref' (flagged) list."""
+    return ",".join(f"{x[0]}{'f' if x[1] else ''}" for x in data)
+
+
+def final_score(score: int, flag: int) -> int:
+    """Flagged scores count double (a flagged 0 stays 0)."""
+    return score * 2 if flag else score
+
+
+def _played(data: Games, sessions: _ty.Sequence[int]) -> list[tuple[int, int, int]]:
+    return [(score, flag, session) for (score, flag), session in zip(data, sessions) if score is not None]
+
+
+def aggregates(data: Games) -> str:
+    finals = [final_score(score, flag) for score, flag in data if score is not None]
+    if not finals:
+        return "No games played."
+    wins = finals.count(0)
+    losses = [score for score in finals if score != 0]
+    flagged = sum(1 for score, flag in data if score is not None and flag)
+    return (f"Games: {len(finals)}, wins: {wins} ({round(wins / len(finals) * 100)}%), "
+            f"flagged: {flagged}, average final score: {round(sum(finals) / len(finals), 1)}, "
+            f"average lost score: {round(sum(losses) / len(losses), 1) if losses else 0}, "
+            f"highest final score: {max(finals)}, total points: {sum(finals)}.")
+
+
+def histogram(data: Games) -> str:
+    counts = Counter()
+    for score, flag in data:
+        if score is None:
+            continue
+        final = final_score(score, flag)
+        for low, high in HISTOGRAM_BUCKETS:
+            if low <= final <= high:
+                counts[(low, high)] += 1
+                break
+    parts = [f"{'0' if high == 0 else f'{low}+' if high >= 10 ** 9 else f'{low}-{high}'}: {counts[(low, high)]}"
+             for low, high in HISTOGRAM_BUCKETS if counts[(low, high)]]
+    return "Final scores: " + ", ".join(parts) + "." if parts else ""
+
+
+def session_summaries(data: Games, sessions: _ty.Sequence[int]) -> list[str]:
+    """One line per session, oldest first."""
+    per_session: dict[int, list[int]] = {}
+    for score, flag, session in _played(data, sessions):
+        per_session.setdefault(session, []).append(final_score(score, flag))
+    return [f"S{session}: {len(finals)} games, {finals.count(0)} wins, max {max(finals)}, "
+            f"avg {round(sum(finals) / len(finals), 1)}"
+            for session, finals in per_session.items()]
+
+
+def compact_history(data: Games, sessions: _ty.Sequence[int], budget: int) -> str:
+    """
+    The raw game list if it fits into budget tokens. Otherwise aggregates and a histogram of the
+    whole history, then as many of the most recent raw games (about half of what is left) and
+    of the most recent per-session summaries as still fit.
+    """
+    raw = format_games(data)
+    if estimate_tokens(raw) <= budget:
+        return raw
+
+    parts = [aggregates(data), histogram(data)]
+    headers = "Last 0000 sessions, oldest first: . Most recent 0000 games, oldest first: ."
+    remaining = budget - sum(estimate_tokens(part) for part in parts) - estimate_tokens(headers)
+
+    recent: list[str] = []
+    recent_budget = remaining // 2
+    for score, flag, _ in reversed(_played(data, sessions)):
+        game = f"{score}{'f' if flag else ''},"
+        cost = estimate_tokens(game)
+        if cost > recent_budget:
+            break
+        recent.append(game)
+        recent_budget -= cost
+        remaining -= cost
+
+    summaries: list[str] = []
+    for line in reversed(session_summaries(data, sessions)):
+        cost = estimate_tokens(line) + 1
+        if cost > remaining:
+            break
+        summaries.append(line)
+        remaining -= cost
+    if summaries:
+        parts.append(f"Last {len(summaries)} sessions, oldest first: " + "; ".join(reversed(summaries)) + ".")
+    if recent:
+        parts.append(f"Most recent {len(recent)} games, oldest first: {''.join(reversed(recent)).rstrip(',')}.")
+    return " ".join(part for part in parts if part)
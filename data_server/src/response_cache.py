@@ -0,0 +1,84 @@
+"""On-disk cache of generated model responses, so the same question is only sent to the model once"""
+import threading
+import hashlib
+import sqlite3
+import time
+
+import typing as _ty
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of model responses in its own SQLite file, it survives restarts.
+
+    Entries are keyed on the model, a hash of the prompt and the data version the prompt was
+    built from, so new scores never get answered from an old response.
+    """
+    def __init__(self, path: str, max_entries: int = 1000, ttl: float = 7 * 24 * 60 * 60):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl  # Seconds an entry is served after it was generated
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def key(model: str, prompt: str, data_version: str) -> str:
+        return f"{model}:{data_version}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO responses (key, model, response, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                       (key, model, response, now, now))
+            expired = db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+            # Least recently used past max_entries
+            evicted = db.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,)).rowcount
+            db.commit()
+            self.evictions += expired + evicted
+
+    def clear(self):
+        with self._lock:
+            self._db().execute("DELETE FROM responses")
+            self._db().commit()
+
+    def info(self) -> dict[str, _ty.Any]:
+        with self._lock:
+            entries = self._db().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions, entries=entries,
+                        max_entries=self.max_entries, ttl=self.ttl, path=self.path)
@@ -1,6 +1,23 @@
+import argparse
 import sqlite3
 
 
+parser = argparse.ArgumentParser(description="Migrate old_data.db into data.db, or normalize a database in place.")
+parser.add_argument("--normalize", metavar="DB",
+                    help="stream the scores and hands tables of DB into rounds and round_scores instead")
+parser.add_argument("--batch-size", type=int, default=1000, help="rows read and written per batch (--normalize)")
+parser.add_argument("--keep-legacy", action="store_true", help="keep the scores and hands tables (--normalize)")
+args = parser.parse_args()
+
+if args.normalize:
+    import normalized
+
+    conn = sqlite3.connect(args.normalize)
+    rounds = normalized.migrate(conn, args.batch_size, drop_legacy=not args.keep_legacy)
+    conn.close()
+    print(f"Migrated {rounds} rounds of {args.normalize} into rounds and round_scores")
+    raise SystemExit(0)
+
 conn = sqlite3.connect("old_data.db")
 cursor = conn.cursor()
 
@@ -0,0 +1,24 @@
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    """The server module on a fresh create_db database (and response cache) in tmp_path."""
+    import main
+    from sqlite_pool import ConnectionManager
+    from response_cache import ResponseCache
+    from generation_queue import GenerationQueue
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "DB_NAME", str(tmp_path / "data.db"))
+    monkeypatch.setattr(main, "DB", ConnectionManager(main.DB_NAME))
+    monkeypatch.setattr(main, "RESPONSE_CACHE", ResponseCache(str(tmp_path / "responses.db")))
+    monkeypatch.setattr(main, "OLLAMA_QUEUE", GenerationQueue(max_concurrent=2, max_queued=8, timeout=10.0))
+    main.create_db()
+    yield main
+    main.DB.close_all()
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import typing as _ty
+
+import pytest
+import requests
+from werkzeug.test import EnvironBuilder
+
+ROUTES = [("/player_quote_stream/phi3/Alice", "/player_quote/phi3/Alice"),
+          ("/player_info_stream/mistral/Alice/Why%20does%20she%20lose", "/player_info/mistral/Alice/Why%20does%20she%20lose")]
+
+
+def wait_until(condition: _ty.Callable[[], bool], timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def open_stream(main, url: str) -> _ty.Iterable[bytes]:
+    """The body of a streamed response, unread (the test client would read it right away)."""
+    return main.app(EnvironBuilder(path=url).get_environ(), lambda status, headers: None)
+
+
+def coalesced_json_request(main, url: str) -> tuple[threading.Thread, dict]:
+    """GET url in a thread once it joined the flight the stream leads, the response ends up in the dict."""
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(resp=main.app.test_client().get(url)))
+    thread.start()
+    wait_until(lambda: main.OLLAMA_QUEUE.coalesced == 1)
+    return thread, result
+
+
+@pytest.fixture
+def failing_model(main, monkeypatch):
+    def stream_ollama(model, prompt):
+        raise requests.exceptions.ConnectionError("model host down")
+        yield
+    monkeypatch.setattr(main, "stream_ollama", stream_ollama)
+    monkeypatch.setattr(main, "query_ollama", lambda *args: pytest.fail("a coalesced request must not generate"))
+    return main
+
+
+@pytest.mark.parametrize("stream_url, json_url", ROUTES)
+def test_json_waiter_behind_failing_stream_gets_the_error(failing_model, stream_url, json_url):
+    main = failing_model
+    stream = open_stream(main, stream_url)  # Leads the flight
+    thread, result = coalesced_json_request(main, json_url)
+    body = b"".join(stream).decode()
+    stream.close()
+    thread.join(5)
+    assert "event: error" in body and "model host down" in body
+    assert result["resp"].status_code == 502
+    assert "model host down" in result["resp"].get_json()["error"]
+    assert main.OLLAMA_QUEUE.info()["active"] == 0
+
+
+@pytest.mark.parametrize("stream_url, json_url", ROUTES)
+def test_json_waiter_behind_disconnected_stream_gets_an_error(failing_model, stream_url, json_url):
+    main = failing_model
+    stream = open_stream(main, stream_url)
+    thread, result = coalesced_json_request(main, json_url)
+    stream.close()  # Client gone before the first chunk
+    thread.join(5)
+    assert result["resp"].status_code == 502
+    assert result["resp"].get_json()["error"]
+    assert main.OLLAMA_QUEUE.info()["active"] == 0
+
+
+def test_failed_generation_is_an_error(main, monkeypatch):
+    monkeypatch.setattr(main, "query_ollama", lambda *args: "Error contacting Ollama: model host down")
+    resp = main.app.test_client().get("/player_quote/phi3/Alice")
+    assert resp.status_code == 502
+    assert "model host down" in resp.get_json()["error"]
@@ -0,0 +1,55 @@
+import sqlite3
+import json
+
+import pytest
+from werkzeug.test import EnvironBuilder
+
+
+@pytest.fixture
+def connections(main, monkeypatch) -> list[sqlite3.Connection]:
+    """Every connection DB.connect hands out from now on."""
+    opened = []
+    connect = main.DB.connect
+
+    def record(*args, **kwargs):
+        opened.append(connect(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(main.DB, "connect", record)
+    return opened
+
+
+def is_closed(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("SELECT 1")
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+def test_streamed_tables(main, connections):
+    resp = main.app.test_client().get("/get_data?layout=columnar")
+    body = json.loads(resp.get_data())
+    assert body["players"]["columns"] == ["id", "name", "colname"]
+    assert [is_closed(conn) for conn in connections] == [True]
+
+
+@pytest.mark.parametrize("url", ["/get_data", "/get_data?since=2&schema=x"])
+def test_unread_body_closes_the_connection(main, connections, url):
+    body = main.app(EnvironBuilder(path=url).get_environ(), lambda status, headers: None)
+    assert not is_closed(connections[0])
+    body.close()  # The client went away before the first chunk
+    assert is_closed(connections[0])
+
+
+def test_not_modified_closes_the_connection(main, connections):
+    client = main.app.test_client()
+    etag = client.get("/get_data").headers["ETag"]
+    with client.get("/get_data", headers={"If-None-Match": etag}) as resp:  # Closed like a WSGI server does
+        assert resp.status_code == 304
+    assert [is_closed(conn) for conn in connections] == [True, True]
+
+
+def test_failed_setup_closes_the_connection(main, connections, monkeypatch):
+    monkeypatch.setattr(main, "served_tables", lambda cursor: 1 / 0)
+    assert main.app.test_client().get("/get_data").status_code == 500
+    assert [is_closed(conn) for conn in connections] == [True]
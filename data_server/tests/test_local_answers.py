@@ -0,0 +1,33 @@
+import pytest
+
+from local_answers import answer_locally
+
+# Finals 0, 20 (doubled 10), 5, 0, 20, absent once, two sessions
+DATA = ((0, 0), (10, 1), (None, 0), (5, 0), (0, 1), (20, 0))
+SESSIONS = (1, 1, 1, 2, 2, 2)
+OTHERS = ("Bob", "Cara")
+
+
+@pytest.mark.parametrize("question, answer", [
+    ("How many wins?", "2"),
+    ("What is the highest score?", "20"),
+    ("What is the lowest score?", "0"),
+    ("What is the win rate?", "40%"),
+    ("How many sessions did Alice play?", "2"),
+    ("How many games?", "5"),
+])
+def test_plain_questions_are_answered(question, answer):
+    assert answer_locally(question, DATA, SESSIONS, OTHERS) == answer
+
+
+@pytest.mark.parametrize("question", [
+    "How many wins in session 2?",
+    "What is the lowest non-zero score?",
+    "What is the win rate when Bob plays?",
+    "What is the highest score before doubling?",
+    "What is the highest score in the last session?",
+    "Highest score of Bob?",
+    "What is the average score per session?",
+])
+def test_qualified_questions_go_to_the_model(question):
+    assert answer_locally(question, DATA, SESSIONS, OTHERS) is None
@@ -0,0 +1,80 @@
+import random
+import sqlite3
+
+import pytest
+
+import normalized
+
+PLAYERS = [("Alice", "player1"), ("Bob", "player2"), ("Cara", "player3"), ("Dan", "player4")]
+
+
+def random_history(seed: int, n_rounds: int = 120) -> tuple[list[tuple], dict[int, int]]:
+    """Games (None for absent players, all None separators) and the hand flags of some of them, by scores id."""
+    rng = random.Random(seed)
+    games, hands = [], {}
+    for row_id in range(1, n_rounds + 1):
+        if rng.random() < 0.1:
+            games.append((None,) * len(PLAYERS))
+            continue
+        present = [i for i in range(len(PLAYERS)) if rng.random() < 0.8] or [0]
+        winner = rng.choice(present)
+        games.append(tuple((0 if i == winner else rng.randint(2, 60)) if i in present else None
+                           for i in range(len(PLAYERS))))
+        if rng.random() < 0.2:
+            hands[row_id] = 1
+    return games, hands
+
+
+def legacy_rows(conn: sqlite3.Connection) -> list[tuple]:
+    columns = ", ".join(f"s.{col}" for _, col in PLAYERS)
+    return [(*row[:-1], row[-1] or 0) for row in conn.execute(f"""
+        SELECT s.id, {columns}, (SELECT MAX(flag) FROM hands h WHERE h.scores_id = s.id) FROM scores s ORDER BY s.id
+    """)]
+
+
+@pytest.fixture(params=range(4))
+def history(main, request) -> tuple[sqlite3.Connection, list[tuple], dict[int, int]]:
+    """A legacy database of a random history, and the history."""
+    games, hands = random_history(request.param)
+    main.create_db(PLAYERS, games, hands)
+    conn = sqlite3.connect(main.DB_NAME)
+    yield conn, games, hands
+    conn.close()
+
+
+def test_migrate_round_trips(history):
+    conn, games, _ = history
+    before = legacy_rows(conn)
+    prefixes = [normalized.flags_prefix(conn.cursor(), since) for since in range(0, len(games) + 1, 17)]
+    assert normalized.migrate(conn, batch_size=7) == len(games)
+    assert normalized.is_normalized(conn.cursor())
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name IN ('scores', 'hands')").fetchall() == []
+    assert conn.execute(*normalized.legacy_scores_query(conn.cursor(), with_flag=True)).fetchall() == before
+    assert [normalized.flags_prefix(conn.cursor(), since) for since in range(0, len(games) + 1, 17)] == prefixes
+
+
+def test_sessions_follow_the_separators(history):
+    conn, games, hands = history
+    normalized.migrate(conn)
+    session, expected = 1, {player_id: [] for player_id in range(1, len(PLAYERS) + 1)}
+    for row_id, game in enumerate(games, 1):
+        if all(value is None for value in game):
+            session += 1
+        for player_id, value in enumerate(game, 1):
+            if value is not None:
+                expected[player_id].append((value, hands.get(row_id, 0), session))
+    for player_id, rounds in expected.items():
+        assert [tuple(row) for row in normalized.player_rounds(conn.cursor(), player_id)] == rounds
+
+
+def test_appended_rows_continue_the_open_session(main):
+    main.create_db(PLAYERS[:2], [(0, 5), (None, None), (3, 0)])
+    conn = sqlite3.connect(main.DB_NAME)
+    normalized.migrate(conn)
+    normalized.append_legacy_rows(conn.cursor(), [1, 2], [(4, 0, 9, 1), (5, None, None, None), (6, 0, None, 0)])
+    conn.commit()
+    assert conn.execute("SELECT id, session_id, hand_flag FROM rounds ORDER BY id").fetchall() == [
+        (1, 1, 0), (2, 1, 0), (3, 2, 0), (4, 2, 1), (5, 2, 0), (6, 3, 0)]
+    assert normalized.flags_prefix(conn.cursor(), 3) == [0, 0, 0]
+    assert normalized.flags_prefix(conn.cursor(), 4) == [1, 1, 4]
+    conn.close()
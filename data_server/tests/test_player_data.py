@@ -0,0 +1,38 @@
+import urllib.parse
+import sqlite3
+
+import pytest
+
+import normalized
+
+# create_db's default games, the second one flagged: Alice scores 10, 0 (flagged) | 0
+HANDS = {2: 1}
+
+
+@pytest.fixture(params=["legacy", "normalized"])
+def db(main, request):
+    """The server module on the default games with HANDS, in either schema."""
+    main.create_db(hand_scores=HANDS)
+    if request.param == "normalized":
+        with sqlite3.connect(main.DB_NAME) as conn:
+            normalized.migrate(conn)
+    return main
+
+
+def test_player_data_has_every_game(db):
+    cursor = db.DB.reader().cursor()
+    assert db.player_data(cursor, "Alice") == (((10, 0), (0, 1), (0, 0)), (1, 1, 2))
+    assert db.player_data(cursor, "Cara") == (((15, 0), (7, 1), (22, 0)), (1, 1, 2))
+
+
+@pytest.mark.parametrize("question, answer", [
+    ("How many games?", "3"),
+    ("What is the highest score?", "10"),
+    ("How many wins?", "2"),
+    ("How many sessions?", "2"),
+])
+def test_local_answers_from_the_database(db, question, answer):
+    resp = db.app.test_client().get(f"/player_info/mistral/Alice/{urllib.parse.quote(question)}")
+    assert resp.status_code == 200
+    assert resp.headers["X-Answer-Source"] == "local"
+    assert resp.get_json()["response"] == answer
@@ -0,0 +1,66 @@
+import threading
+import sqlite3
+import gc
+
+import pytest
+
+from sqlite_pool import ConnectionManager
+
+
+@pytest.fixture
+def pool(tmp_path):
+    path = str(tmp_path / "pool.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.close()
+    pool = ConnectionManager(path)
+    yield pool
+    pool.close_all()
+
+
+def in_thread(func):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def is_closed(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("SELECT 1")
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+def test_connections_are_reused_per_thread(pool):
+    reader, writer = pool.reader(), pool.writer()
+    assert pool.reader() is reader and pool.writer() is writer and reader is not writer
+    assert in_thread(pool.reader) is not reader
+    assert pool.stats()["wal"]
+    assert reader.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    with pytest.raises(sqlite3.OperationalError):
+        reader.execute("INSERT INTO t VALUES (1)")
+
+
+def test_thread_connections_close_with_the_thread(pool):
+    conn = in_thread(pool.reader)
+    gc.collect()
+    assert is_closed(conn)
+    assert pool.stats()["connections"] == 0
+
+
+def test_release_rolls_back(pool):
+    writer = pool.writer()
+    writer.execute("INSERT INTO t VALUES (1)")
+    pool.release()
+    assert not writer.in_transaction
+    assert pool.reader().execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_close_all(pool):
+    reader, writer = pool.reader(), pool.writer()
+    pool.close_all()
+    assert is_closed(reader) and is_closed(writer)
+    assert pool.reader() is not reader
@@ -1,6 +1,107 @@
-from collections import defaultdict
+from collections import OrderedDict
+import threading
+import copy
+import time
+import sys
 
-_stats_cache = {}
+from prometheus_client import Histogram
+
+from profiling import REGISTRY, add_server_timing
+
+
+def _approx_size(obj, _seen=None) -> int:
+    """Rough deep size of the dicts/lists/tuples the stats are made of."""
+    _seen = set() if _seen is None else _seen
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_approx_size(k, _seen) + _approx_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_approx_size(v, _seen) for v in obj)
+    return size
+
+
+class StatsCache:
+    """
+    LRU cache for computed stats, bounded by entry count and (approximate) memory.
+
+    Keys are meant to be cheap data versions (e.g. max scores.id and a checksum of the
+    last update) instead of the data itself, so a lookup never walks the history.
+    """
+    def __init__(self, max_entries: int = 16, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self.bytes = 0
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = _approx_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size > self.max_bytes:
+                return value  # Would evict everything and still not fit
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def info(self) -> dict:
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                        entries=len(self._entries), bytes=self.bytes,
+                        max_entries=self.max_entries, max_bytes=self.max_bytes)
+
+
+STATS_CACHE = StatsCache()
+
+METRIC_SECONDS = Histogram(
+    "romee_metric_seconds", "Time of one stats metric for all players: a part of StatsAccumulator.results (kind result), "
+    "or an analyze_np.compute_stats input or field (without the inputs it uses).",
+    ("metric", "kind"), buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                                 0.025, 0.05, 0.1, 0.25, 1.0), registry=REGISTRY)
+
+def record_metric_seconds(seconds: dict[tuple[str, str], float]):
+    """Observe the (kind, metric) timings in METRIC_SECONDS, their total is the "metrics" entry of the request's Server-Timing."""
+    for (kind, metric), value in seconds.items():
+        METRIC_SECONDS.labels(metric, kind).observe(value)
+    add_server_timing("metrics", sum(seconds.values()))
+
+def _lap(seconds: dict[tuple[str, str], float], metric: str, start: float) -> float:
+    """Add the time since start to the result metric, returns now to start the next one from."""
+    now = time.perf_counter()
+    seconds["result", metric] = seconds.get(("result", metric), 0.0) + now - start
+    return now
 
 def normalized_win_equiv(wins, games, actual_size, target_size):
     if actual_size <= 1 or target_size <= 1 or games == 0:
@@ -10,81 +111,9 @@ def normalized_win_equiv(wins, games, actual_size, target_size):
     factor = fair_target / fair_actual
     return wins * factor, games * factor
 
-def calc_games_and_absences(sessions, main_idx):
-    games = absences = 0
-    for session in sessions:
-        for game in session:
-            val = game[main_idx]
-            if val == 1:
-                absences += 1
-            else:
-                games += 1
-    return games, absences
-
-def calc_wins(sessions, main_idx):
-    wins = 0
-    for session in sessions:
-        for game in session:
-            if game[main_idx] == 0:
-                wins += 1
-    return wins
-
-def calc_losses(sessions, main_idx):
-    losses = 0
-    for session in sessions:
-        for game in session:
-            val = game[main_idx]
-            if val not in (0, 1):
-                losses += 1
-    return losses
-
 def calc_win_rate(wins, games):
     return round(100 * wins / games, 2) if games else 0
 
-def calc_avg_points_left(sessions, main_idx):
-    points = []
-    for session in sessions:
-        for game in session:
-            val = game[main_idx]
-            if val not in (0, 1):
-                points.append(val)
-    return round(sum(points) / len(points), 2) if points else 0
-
-def calc_max_points_left(sessions, main_idx):
-    max_points = 0
-    for session in sessions:
-        for game in session:
-            val = game[main_idx]
-            if val not in (0, 1) and val > max_points:
-                max_points = val
-    return max_points
-
-def calc_total_points(sessions, main_idx, absence_as=0, avg_points=None):
-    total = 0
-    count_abs = 0
-    for session in sessions:
-        for game in session:
-            val = game[main_idx]
-            if val == 1:
-                count_abs += 1
-            elif val != 0:
-                total += val
-    if absence_as == 0:
-        return total
-    elif absence_as == 'avg' and avg_points is not None:
-        return int(round(total + count_abs * avg_points))
-    else:
-        return total
-
-def calc_sessions(sessions):
-    return len(sessions)
-
-def calc_win_counts(sessions, main_idx):
-    per_session = []
-    for session in sessions:
-        per_session.append(sum(1 for game in session if game[main_idx] == 0))
-    return per_session
-
 def calc_avg_wins_per_session(win_counts):
     return round(sum(win_counts) / len(win_counts), 2) if win_counts else 0
 
@@ -94,67 +123,6 @@ def calc_best_session_wins(win_counts):
 def calc_worst_session_wins(win_counts):
     return min(win_counts) if win_counts else 0
 
-def calc_longest_streak(sessions, main_idx):
-    max_streak = streak = 0
-    for session in sessions:
-        for game in session:
-            if game[main_idx] == 0:
-                streak += 1
-                max_streak = max(max_streak, streak)
-            else:
-                streak = 0
-    return max_streak
-
-def calc_longest_streak_per_session(sessions, main_idx):
-    max_streaks = []
-    for session in sessions:
-        streak = max_streak = 0
-        for game in session:
-            if game[main_idx] == 0:
-                streak += 1
-                max_streak = max(max_streak, streak)
-            else:
-                streak = 0
-        max_streaks.append(max_streak)
-    return max(max_streaks) if max_streaks else 0
-
-def calc_avg_points_per_session(sessions, main_idx):
-    session_points = []
-    for session in sessions:
-        s_points = sum(game[main_idx] for game in session if game[main_idx] not in (0, 1))
-        session_points.append(s_points)
-    return round(sum(session_points) / len(session_points), 2) if session_points else 0
-
-def calc_game_list(sessions, main_idx):
-    # Returns list of {session, game, val}
-    game_list = []
-    idx = 1
-    for s_idx, session in enumerate(sessions, 1):
-        for game in session:
-            game_list.append({'session': s_idx, 'game': idx, 'val': game[main_idx]})
-            idx += 1
-    return game_list
-
-def calc_global_max_points(sessions, players, top_n=25):
-    # Find top N max points left, globally
-    global_points = []
-    for sess in sessions:
-        for idx, player in enumerate(players):
-            for g in sess:
-                v = g[idx]
-                if v not in (0, 1):
-                    global_points.append((v, idx, player[0]))
-    global_points_sorted = sorted(global_points, key=lambda x: -x[0])
-    global_points_ranking = []
-    seen = set()
-    for rank, (val, idx, name) in enumerate(global_points_sorted, 1):
-        if (name, val) not in seen:
-            global_points_ranking.append((rank, name, val))
-            seen.add((name, val))
-        if len(global_points_ranking) >= top_n:
-            break
-    return global_points_ranking
-
 def calc_player_max_rank(global_max_points_ranking, player_name, max_points):
     player_max_rank = None
     for rank, name, val in global_max_points_ranking:
@@ -163,236 +131,247 @@ def calc_player_max_rank(global_max_points_ranking, player_name, max_points):
             break
     return player_max_rank
 
-def calc_win_ranks(sessions, players, main_idx):
-    all_win_counts = []
-    all_win_rates = []
-    for idx, player in enumerate(players):
-        pl_games = pl_wins = 0
-        for sess in sessions:
-            for g in sess:
-                v = g[idx]
-                if v == 1:
-                    continue
-                pl_games += 1
-                if v == 0:
-                    pl_wins += 1
-        wr = 100 * pl_wins / pl_games if pl_games else 0
-        all_win_counts.append((player[0], pl_wins))
-        all_win_rates.append((player[0], wr))
-    rank_by_wins = sorted(all_win_counts, key=lambda x: -x[1])
-    rank_by_winrate = sorted(all_win_rates, key=lambda x: -x[1])
-    player_winrank = next((i + 1 for i, (n, w) in enumerate(rank_by_wins) if n == players[main_idx][0]), None)
-    player_winraterank = next((i + 1 for i, (n, w) in enumerate(rank_by_winrate) if n == players[main_idx][0]), None)
-    return player_winrank, player_winraterank
-
-def calc_win_chance_with(sessions, players, main_idx):
-    win_with = {i: [0, 0] for i in range(len(players)) if i != main_idx}
-    for session in sessions:
-        for game in session:
-            val = game[main_idx]
-            for idx in win_with:
-                if game[idx] != 1:
-                    win_with[idx][1] += 1
-                    if val == 0:
-                        win_with[idx][0] += 1
-    win_chance_with = {}
-    for idx in win_with:
-        other_name = players[idx][0]
-        total = win_with[idx][1]
-        won = win_with[idx][0]
-        win_chance_with[other_name] = (100 * won / total) if total else 0
-    return win_chance_with
-
-def calc_win_with_by_size(sessions, players, main_idx):
-    win_with_detailed = defaultdict(lambda: defaultdict(lambda: [0, 0]))
-    for session in sessions:
-        for game in session:
-            present = [idx for idx, v in enumerate(game) if v != 1]
-            if main_idx not in present:
-                continue
-            num_players = len(present)
-            main_val = game[main_idx]
-            for idx in present:
-                if idx == main_idx:
-                    continue
-                win_with_detailed[idx][num_players][1] += 1
-                if main_val == 0:
-                    win_with_detailed[idx][num_players][0] += 1
-    win_with_by_size_display = []
-    for idx, name in enumerate(players):
-        if idx == main_idx:
-            continue
-        for num_players in sorted(win_with_detailed[idx]):
-            wins, games = win_with_detailed[idx][num_players]
-            rate = (wins / games) * 100 if games else 0
-            fair_pct = 100 / num_players if games else 0
-            diff = rate - fair_pct
-            win_with_by_size_display.append({
-                "player": name[0],
-                "num_players": num_players,
-                "rate": round(rate, 2),
-                "fair": round(fair_pct, 2),
-                "diff": round(diff, 2),
-                "games": games,
-            })
-    return win_with_by_size_display
-
-def calc_normalized_win_chance_with(sessions, players, main_idx):
-    max_group_size = max(
-        (sum(1 for v in game if v != 1)
-         for session in sessions for game in session),
-        default=2
-    )
-    win_with_detailed = defaultdict(lambda: defaultdict(lambda: [0, 0]))
-    for session in sessions:
-        for game in session:
-            present = [idx for idx, v in enumerate(game) if v != 1]
-            if main_idx not in present:
-                continue
-            num_players = len(present)
-            main_val = game[main_idx]
-            for idx in present:
-                if idx == main_idx:
-                    continue
-                win_with_detailed[idx][num_players][1] += 1
-                if main_val == 0:
-                    win_with_detailed[idx][num_players][0] += 1
-    normalized_win_chance_with = {}
-    for idx, name in enumerate(players):
-        if idx == main_idx:
-            continue
-        adj_wins = 0.0
-        adj_games = 0.0
-        for num_players in sorted(win_with_detailed[idx]):
-            wins, games = win_with_detailed[idx][num_players]
-            norm_wins, norm_games = normalized_win_equiv(wins, games, num_players, max_group_size)
-            adj_wins += norm_wins
-            adj_games += norm_games
-        norm_rate = (adj_wins / adj_games) * 100 if adj_games else 0
-        normalized_win_chance_with[name[0]] = round(norm_rate, 2)
-    return normalized_win_chance_with
-
-def calc_win_rate_by_game_size(sessions, main_idx):
+
+class StatsAccumulator:
     """
-    Returns a dict: {number_of_players: win_rate_percentage}
+    Folds rounds into running aggregates for every player at once.
+
+    Every metric of results() is derived from counters kept here, so one scan
+    over the round data is enough to fill in the stats of all players.
+    Rounds belong to the open session until end_session() is called.
+    The per-game values are not kept, the game list is read from the rounds (see analyze_np.calc_game_list).
     """
-    win_by_size = defaultdict(lambda: [0, 0])  # {num_players: [wins, total]}
-    for session in sessions:
-        for game in session:
-            present = [v for v in game if v != 1]
-            num_players = len(present)
-            val = game[main_idx]
+    def __init__(self, n_players: int):
+        n = n_players
+        self.n_players = n
+        self.rounds = 0
+        self.max_group_size = 0
+        self.closed_sessions = 0
+        self.games = [0] * n
+        self.absences = [0] * n
+        self.wins = [0] * n
+        self.hand_wins = [0] * n
+        self.losses = [0] * n
+        self.points = [0] * n
+        self.max_points = [0] * n
+        self.streak = [0] * n
+        self.max_streak = [0] * n
+        self.session_wins: list[list[int]] = [[] for _ in range(n)]
+        self.session_points: list[list[int]] = [[] for _ in range(n)]
+        self.session_max_streak = [0] * n
+        # Open session
+        self.cur_rounds = 0
+        self.cur_wins = [0] * n
+        self.cur_points = [0] * n
+        self.cur_streak = [0] * n
+        self.cur_max_streak = [0] * n
+        # Pairwise tallies: wins of i with j present, and [wins, games] of i with j by group size
+        self.with_wins = [[0] * n for _ in range(n)]
+        self.with_by_size: list[list[dict[int, list[int]]]] = [[{} for _ in range(n)] for _ in range(n)]
+        self.by_size: list[dict[int, list[int]]] = [{} for _ in range(n)]
+        # value -> {(session, player_idx): occurrences}, for the global max points ranking
+        self.point_sites: dict[int, dict[tuple[int, int], int]] = {}
+
+    def add_round(self, scores, hand: bool = False):
+        session_no = self.closed_sessions + 1
+        present = [i for i, v in enumerate(scores) if v != 1]
+        size = len(present)
+        if size > self.max_group_size:
+            self.max_group_size = size
+        self.rounds += 1
+        self.cur_rounds += 1
+
+        for i, val in enumerate(scores):
             if val == 1:
-                continue  # absent
-            win_by_size[num_players][1] += 1
+                self.absences[i] += 1
+                self.streak[i] = self.cur_streak[i] = 0
+                continue
+            self.games[i] += 1
+            counts = self.by_size[i].setdefault(size, [0, 0])
+            counts[1] += 1
             if val == 0:
-                win_by_size[num_players][0] += 1
-    result = []
-    for size in sorted(win_by_size):
-        wins, total = win_by_size[size]
-        rate = (wins / total) * 100 if total else 0
-        fair = 100 / size if size else 0
-        diff = rate - fair
-        result.append({
-            "num_players": size,
-            "rate": round(rate, 2),
-            "fair": round(fair, 2),
-            "diff": round(diff, 2),
-            "games": total
-        })
-    return result
-
-def calculate_romee_hand_wins(sessions, main_idx) -> int:
-    """
-    Returns an int: number_of_romee_hand_wins
-
-        wins = 0
-    for i, session in enumerate(sessions):
-        for game in session:
-            val = game[main_idx]
-            if val == 1: continue  # absent
-            elif val == 0:
-                if romee_hand_scores[i] == 1:
-                    wins += 1
-    return wins
-    """
-    wins = 0
-    i = 0
-    for session in sessions:
-        for game in session:
-            if game[main_idx] == 0 and game.hand:
-                wins += 1
-            i += 1
-    return wins
-
-
-def analyze_stats(sessions, players, main_idx):
-    # Cache key
-    cache_key = (tuple(tuple(map(tuple, sessions))), tuple(players), main_idx)
-    if cache_key in _stats_cache:
-        return _stats_cache[cache_key]
-
-    games, absences = calc_games_and_absences(sessions, main_idx)
-    wins = calc_wins(sessions, main_idx)
-    romee_hand_wins = calculate_romee_hand_wins(sessions, main_idx)
-    romee_hand_win_rate = calc_win_rate(romee_hand_wins, games)
-    losses = calc_losses(sessions, main_idx)
-    win_rate = calc_win_rate(wins, games)
-    avg_points_left = calc_avg_points_left(sessions, main_idx)
-    max_points = calc_max_points_left(sessions, main_idx)
-    total_points_absence_zero = calc_total_points(sessions, main_idx, absence_as=0)
-    total_points_absence_avg = calc_total_points(sessions, main_idx, absence_as='avg', avg_points=avg_points_left)
-    session_count = calc_sessions(sessions)
-    win_counts = calc_win_counts(sessions, main_idx)
-    avg_wins_per_session = calc_avg_wins_per_session(win_counts)
-    best_session_wins = calc_best_session_wins(win_counts)
-    worst_session_wins = calc_worst_session_wins(win_counts)
-    longest_streak = calc_longest_streak(sessions, main_idx)
-    longest_streak_per_session = calc_longest_streak_per_session(sessions, main_idx)
-    avg_points_per_session = calc_avg_points_per_session(sessions, main_idx)
-    game_list = calc_game_list(sessions, main_idx)
-    global_max_points_ranking = calc_global_max_points(sessions, players, top_n=25)
-    player_max_rank = calc_player_max_rank(global_max_points_ranking, players[main_idx][0], max_points)
-    player_winrank, player_winraterank = calc_win_ranks(sessions, players, main_idx)
-    win_chance_with = calc_win_chance_with(sessions, players, main_idx)
-    win_with_by_size = calc_win_with_by_size(sessions, players, main_idx)
-    normalized_win_chance_with = calc_normalized_win_chance_with(sessions, players, main_idx)
-    max_group_size = max(
-        (sum(1 for v in game if v != 1)
-         for session in sessions for game in session),
-        default=2
-    )
-    win_rate_by_game_size = calc_win_rate_by_game_size(sessions, main_idx)
-
-    result = dict(
-        games=games,
-        absences=absences,
-        wins=wins,
-        romee_hand_wins=romee_hand_wins,
-        romee_hand_win_rate=romee_hand_win_rate,
-        losses=losses,
-        win_rate=win_rate,
-        avg_points_left=avg_points_left,
-        max_points=max_points,
-        total_points_absence_zero=total_points_absence_zero,
-        total_points_absence_avg=total_points_absence_avg,
-        sessions=session_count,
-        avg_wins_per_session=avg_wins_per_session,
-        best_session_wins=best_session_wins,
-        worst_session_wins=worst_session_wins,
-        longest_streak=longest_streak,
-        longest_streak_per_session=longest_streak_per_session,
-        avg_points_per_session=avg_points_per_session,
-        game_list=game_list,
-        global_max_points=global_max_points_ranking,
-        player_max_rank=player_max_rank,
-        winrank=player_winrank,
-        winraterank=player_winraterank,
-        win_chance_with=win_chance_with,
-        win_with_by_size=win_with_by_size,
-        normalized_win_chance_with=normalized_win_chance_with,
-        max_group_size=max_group_size,
-        general_win_by_size=win_rate_by_game_size,
-    )
-    _stats_cache[cache_key] = result
-    return result
+                counts[0] += 1
+                self.wins[i] += 1
+                self.cur_wins[i] += 1
+                if hand:
+                    self.hand_wins[i] += 1
+                self.streak[i] += 1
+                self.cur_streak[i] += 1
+                if self.streak[i] > self.max_streak[i]:
+                    self.max_streak[i] = self.streak[i]
+                if self.cur_streak[i] > self.cur_max_streak[i]:
+                    self.cur_max_streak[i] = self.cur_streak[i]
+            else:
+                self.streak[i] = self.cur_streak[i] = 0
+                self.losses[i] += 1
+                self.points[i] += val
+                self.cur_points[i] += val
+                if val > self.max_points[i]:
+                    self.max_points[i] = val
+                sites = self.point_sites.setdefault(val, {})
+                sites[(session_no, i)] = sites.get((session_no, i), 0) + 1
+
+        for i in present:
+            won = scores[i] == 0
+            with_wins = self.with_wins[i]
+            with_by_size = self.with_by_size[i]
+            for j in present:
+                if j == i:
+                    continue
+                counts = with_by_size[j].setdefault(size, [0, 0])
+                counts[1] += 1
+                if won:
+                    counts[0] += 1
+                    with_wins[j] += 1
+
+    def end_session(self):
+        if not self.cur_rounds:
+            return
+        for i in range(self.n_players):
+            self.session_wins[i].append(self.cur_wins[i])
+            self.session_points[i].append(self.cur_points[i])
+            if self.cur_max_streak[i] > self.session_max_streak[i]:
+                self.session_max_streak[i] = self.cur_max_streak[i]
+            self.cur_wins[i] = self.cur_points[i] = self.cur_streak[i] = self.cur_max_streak[i] = 0
+        self.cur_rounds = 0
+        self.closed_sessions += 1
+
+    def copy(self) -> "StatsAccumulator":
+        """An independent copy, with every container copied at the depth it is nested (no deepcopy)."""
+        clone = copy.copy(self)
+        for name in ("games", "absences", "wins", "hand_wins", "losses", "points", "max_points", "streak", "max_streak",
+                     "session_max_streak", "cur_wins", "cur_points", "cur_streak", "cur_max_streak"):
+            setattr(clone, name, list(getattr(self, name)))
+        clone.session_wins = [list(wins) for wins in self.session_wins]
+        clone.session_points = [list(points) for points in self.session_points]
+        clone.with_wins = [list(row) for row in self.with_wins]
+        clone.by_size = [{size: list(counts) for size, counts in sizes.items()} for sizes in self.by_size]
+        clone.with_by_size = [[{size: list(counts) for size, counts in sizes.items()} for sizes in row]
+                              for row in self.with_by_size]
+        clone.point_sites = {val: dict(sites) for val, sites in self.point_sites.items()}
+        return clone
+
+    def _global_max_points(self, players, top_n):
+        ranking = []
+        seen = set()
+        base = 0
+        for val in sorted(self.point_sites, reverse=True):
+            sites = self.point_sites[val]
+            before = 0
+            for (_, idx), count in sorted(sites.items()):
+                name = players[idx][0]
+                if (name, val) not in seen:
+                    ranking.append((base + before + 1, name, val))
+                    seen.add((name, val))
+                    if len(ranking) >= top_n:
+                        return ranking
+                before += count
+            base += before
+        return ranking
+
+    def results(self, players, top_n=25) -> list[dict]:
+        """The stats of every player, how long each part took goes into METRIC_SECONDS (see record_metric_seconds)."""
+        seconds: dict[tuple[str, str], float] = {}
+        start = time.perf_counter()
+        n = self.n_players
+        open_session = self.cur_rounds > 0
+        session_count = self.closed_sessions + open_session
+        max_group_size = self.max_group_size if self.rounds else 2
+        global_max_points_ranking = self._global_max_points(players, top_n)
+        start = _lap(seconds, "global_max_points", start)
+
+        rank_by_wins = sorted(((players[i][0], self.wins[i]) for i in range(n)), key=lambda x: -x[1])
+        rank_by_winrate = sorted(((players[i][0], 100 * self.wins[i] / self.games[i] if self.games[i] else 0)
+                                  for i in range(n)), key=lambda x: -x[1])
+        start = _lap(seconds, "ranks", start)
+
+        all_stats = []
+        for main_idx in range(n):
+            name = players[main_idx][0]
+            games, wins = self.games[main_idx], self.wins[main_idx]
+            win_counts = self.session_wins[main_idx] + ([self.cur_wins[main_idx]] if open_session else [])
+            session_points = self.session_points[main_idx] + ([self.cur_points[main_idx]] if open_session else [])
+            longest_streak_per_session = max(self.session_max_streak[main_idx],
+                                             self.cur_max_streak[main_idx] if open_session else 0)
+            losses = self.losses[main_idx]
+            avg_points_left = round(self.points[main_idx] / losses, 2) if losses else 0
+            max_points = self.max_points[main_idx]
+            start = _lap(seconds, "totals", start)
+
+            win_chance_with = {}
+            win_with_by_size = []
+            normalized_win_chance_with = {}
+            for idx in range(n):
+                if idx == main_idx:
+                    continue
+                other_name = players[idx][0]
+                total = self.games[idx]
+                win_chance_with[other_name] = (100 * self.with_wins[main_idx][idx] / total) if total else 0
+                detailed = self.with_by_size[main_idx][idx]
+                adj_wins = 0.0
+                adj_games = 0.0
+                for num_players in sorted(detailed):
+                    size_wins, size_games = detailed[num_players]
+                    rate = (size_wins / size_games) * 100 if size_games else 0
+                    fair_pct = 100 / num_players if size_games else 0
+                    win_with_by_size.append({
+                        "player": other_name,
+                        "num_players": num_players,
+                        "rate": round(rate, 2),
+                        "fair": round(fair_pct, 2),
+                        "diff": round(rate - fair_pct, 2),
+                        "games": size_games,
+                    })
+                    norm_wins, norm_games = normalized_win_equiv(size_wins, size_games, num_players, max_group_size)
+                    adj_wins += norm_wins
+                    adj_games += norm_games
+                norm_rate = (adj_wins / adj_games) * 100 if adj_games else 0
+                normalized_win_chance_with[other_name] = round(norm_rate, 2)
+            start = _lap(seconds, "win_with", start)
+
+            win_rate_by_game_size = []
+            for size in sorted(self.by_size[main_idx]):
+                size_wins, total = self.by_size[main_idx][size]
+                rate = (size_wins / total) * 100 if total else 0
+                fair = 100 / size if size else 0
+                win_rate_by_game_size.append({
+                    "num_players": size,
+                    "rate": round(rate, 2),
+                    "fair": round(fair, 2),
+                    "diff": round(rate - fair, 2),
+                    "games": total
+                })
+            start = _lap(seconds, "general_win_by_size", start)
+
+            all_stats.append(dict(
+                games=games,
+                absences=self.absences[main_idx],
+                wins=wins,
+                romee_hand_wins=self.hand_wins[main_idx],
+                romee_hand_win_rate=calc_win_rate(self.hand_wins[main_idx], games),
+                losses=losses,
+                win_rate=calc_win_rate(wins, games),
+                avg_points_left=avg_points_left,
+                max_points=max_points,
+                total_points_absence_zero=self.points[main_idx],
+                total_points_absence_avg=int(round(self.points[main_idx] + self.absences[main_idx] * avg_points_left)),
+                sessions=session_count,
+                avg_wins_per_session=calc_avg_wins_per_session(win_counts),
+                best_session_wins=calc_best_session_wins(win_counts),
+                worst_session_wins=calc_worst_session_wins(win_counts),
+                longest_streak=self.max_streak[main_idx],
+                longest_streak_per_session=longest_streak_per_session,
+                avg_points_per_session=round(sum(session_points) / len(session_points), 2) if session_points else 0,
+                global_max_points=global_max_points_ranking,
+                player_max_rank=calc_player_max_rank(global_max_points_ranking, name, max_points),
+                winrank=next((i + 1 for i, (n_, w) in enumerate(rank_by_wins) if n_ == name), None),
+                winraterank=next((i + 1 for i, (n_, w) in enumerate(rank_by_winrate) if n_ == name), None),
+                win_chance_with=win_chance_with,
+                win_with_by_size=win_with_by_size,
+                normalized_win_chance_with=normalized_win_chance_with,
+                max_group_size=max_group_size,
+                general_win_by_size=win_rate_by_game_size,
+            ))
+            start = _lap(seconds, "totals", start)
+        record_metric_seconds(seconds)
+        return all_stats
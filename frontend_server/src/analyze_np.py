@@ -0,0 +1,301 @@
+"""The stats metrics vectorized with NumPy over a ScoreMatrix, computed lazily per field (see compute_stats)"""
+import time
+
+import numpy as np
+
+from analyze import (normalized_win_equiv, calc_win_rate, calc_avg_wins_per_session, calc_best_session_wins,
+                     calc_worst_session_wins, calc_player_max_rank, record_metric_seconds)
+from scorematrix import ScoreMatrix, ABSENT
+
+import typing as _ty
+
+# Every helper takes the scores as a 1-D column (one player) or a 2-D matrix (all players)
+# and reduces along axis 0, the INPUTS below reduce all players at once.
+
+
+def _wins(scores):
+    return scores == 0
+
+def _present(scores):
+    return scores != ABSENT
+
+def _losses(scores):
+    return (scores != 0) & (scores != ABSENT)
+
+def _points(scores):
+    return np.where(_losses(scores), scores, 0).astype(np.int64)
+
+def _per_session(m: ScoreMatrix, values):
+    if not m.n_sessions:
+        return np.zeros((0,) + values.shape[1:], dtype=np.int64)
+    return np.add.reduceat(values.astype(np.int64), m.session_offsets[:-1], axis=0)
+
+def _longest_run(m: ScoreMatrix, flags, per_session=False):
+    if not len(flags):
+        return np.zeros(flags.shape[1:], dtype=np.int64)
+    count = np.cumsum(flags, axis=0, dtype=np.int64)
+    # The run restarts after every miss (and at every session start if per_session)
+    base = np.where(flags, 0, count)
+    if per_session:
+        starts = m.session_offsets[1:-1]
+        base[starts] = np.maximum(base[starts], count[starts - 1])
+    return (count - np.maximum.accumulate(base, axis=0)).max(axis=0)
+
+def _group_sizes(m: ScoreMatrix):
+    return _present(m.scores).sum(axis=1)
+
+def _max_group_size(m: ScoreMatrix):
+    return int(_group_sizes(m).max()) if m.n_games else 2
+
+
+def calc_game_list(m: ScoreMatrix, main_idx):
+    sessions = (m.session_index + 1).tolist()
+    return [{'session': s_idx, 'game': idx, 'val': val}
+            for idx, (s_idx, val) in enumerate(zip(sessions, m.scores[:, main_idx].tolist()), 1)]
+
+def calc_game_list_page(m: ScoreMatrix, main_idx, after=0, limit=50, session=None, min_val=None, max_val=None):
+    """
+    The entries of calc_game_list past game number after, at most limit of them and only those in session
+    and with min_val <= val <= max_val. Only the rounds of the slice that is asked for are read.
+    Returns (entries, the game number to continue after or None if there are no more).
+    """
+    start, stop = after, m.n_games
+    if session is not None:
+        if not 1 <= session <= m.n_sessions:
+            return [], None
+        start, stop = max(start, int(m.session_offsets[session - 1])), int(m.session_offsets[session])
+    vals = m.scores[start:stop, main_idx]
+    mask = np.ones(len(vals), dtype=bool)
+    if min_val is not None:
+        mask &= vals >= min_val
+    if max_val is not None:
+        mask &= vals <= max_val
+    games = np.flatnonzero(mask)[:limit + 1] + start
+    more = len(games) > limit
+    games = games[:limit]
+    sessions = np.searchsorted(m.session_offsets, games, side="right")
+    entries = [{'session': s_idx, 'game': idx + 1, 'val': val}
+               for idx, s_idx, val in zip(games.tolist(), sessions.tolist(), m.scores[games, main_idx].tolist())]
+    return entries, entries[-1]['game'] if more else None
+
+def calc_global_max_points(m: ScoreMatrix, players, top_n=25):
+    rows, cols = np.nonzero(_losses(m.scores))
+    vals = m.scores[rows, cols].astype(np.int64)
+    # Same order as the nested session -> player -> game scan, sorted by points descending
+    order = np.lexsort((rows, cols, m.session_index[rows], -vals))
+    vals, cols = vals[order], cols[order]
+    # Only the first (rank-wise) occurrence of every (player, points) pair can make the list
+    _, first = np.unique(np.stack((cols, vals), axis=1), axis=0, return_index=True)
+    first.sort()
+    global_points_ranking = []
+    seen = set()
+    for pos in first.tolist():
+        name, val = players[int(cols[pos])][0], int(vals[pos])
+        if (name, val) not in seen:
+            global_points_ranking.append((pos + 1, name, val))
+            seen.add((name, val))
+        if len(global_points_ranking) >= top_n:
+            break
+    return global_points_ranking
+
+def _ranks(players, wins, games):
+    all_win_counts = [(player[0], w) for player, w in zip(players, wins)]
+    all_win_rates = [(player[0], 100 * w / g if g else 0) for player, w, g in zip(players, wins, games)]
+    return sorted(all_win_counts, key=lambda x: -x[1]), sorted(all_win_rates, key=lambda x: -x[1])
+
+def _with_wins(m: ScoreMatrix):
+    """[i, j] = games won by i with j present."""
+    present = _present(m.scores).astype(np.int64)
+    return _wins(m.scores).astype(np.int64).T @ present, present.sum(axis=0)
+
+def _with_by_size(m: ScoreMatrix):
+    """{group size: ([i, j] wins of i with j present, [i, j] games of i and j together)}"""
+    sizes = _group_sizes(m)
+    present = _present(m.scores).astype(np.int64)
+    wins = _wins(m.scores).astype(np.int64)
+    return {int(size): (wins[sizes == size].T @ present[sizes == size],
+                        present[sizes == size].T @ present[sizes == size])
+            for size in np.unique(sizes).tolist()}
+
+def _win_chance_with(players, main_idx, with_wins, present_counts):
+    win_chance_with = {}
+    for idx in range(len(players)):
+        if idx == main_idx:
+            continue
+        total = int(present_counts[idx])
+        win_chance_with[players[idx][0]] = (100 * int(with_wins[main_idx, idx]) / total) if total else 0
+    return win_chance_with
+
+def _win_with_by_size(players, main_idx, by_size):
+    win_with_by_size_display = []
+    for idx, name in enumerate(players):
+        if idx == main_idx:
+            continue
+        for num_players, (wins, games) in sorted(by_size.items()):
+            games = int(games[main_idx, idx])
+            if not games:
+                continue
+            wins = int(wins[main_idx, idx])
+            rate = (wins / games) * 100
+            fair_pct = 100 / num_players
+            win_with_by_size_display.append({
+                "player": name[0],
+                "num_players": num_players,
+                "rate": round(rate, 2),
+                "fair": round(fair_pct, 2),
+                "diff": round(rate - fair_pct, 2),
+                "games": games,
+            })
+    return win_with_by_size_display
+
+def _normalized_win_chance_with(players, main_idx, by_size, max_group_size):
+    normalized_win_chance_with = {}
+    for idx, name in enumerate(players):
+        if idx == main_idx:
+            continue
+        adj_wins = 0.0
+        adj_games = 0.0
+        for num_players, (wins, games) in sorted(by_size.items()):
+            if not games[main_idx, idx]:
+                continue
+            norm_wins, norm_games = normalized_win_equiv(int(wins[main_idx, idx]), int(games[main_idx, idx]),
+                                                         num_players, max_group_size)
+            adj_wins += norm_wins
+            adj_games += norm_games
+        norm_rate = (adj_wins / adj_games) * 100 if adj_games else 0
+        normalized_win_chance_with[name[0]] = round(norm_rate, 2)
+    return normalized_win_chance_with
+
+def _win_rate_by_game_size(by_size, main_idx):
+    result = []
+    for size, (wins, games) in sorted(by_size.items()):
+        total = int(games[main_idx, main_idx])
+        if not total:
+            continue
+        rate = (int(wins[main_idx, main_idx]) / total) * 100
+        fair = 100 / size if size else 0
+        result.append({
+            "num_players": size,
+            "rate": round(rate, 2),
+            "fair": round(fair, 2),
+            "diff": round(rate - fair, 2),
+            "games": total
+        })
+    return result
+
+# Lazily computed metrics. INPUTS are reduced for all players at once and shared between fields,
+# FIELDS are the per-player result keys of analyze.StatsAccumulator.results and game_list. Both map a name to
+# (function, names of the INPUTS it needs), an input function gets (evaluation, *inputs)
+# and a field function (evaluation, player index, *inputs).
+INPUTS: dict[str, tuple[_ty.Callable, tuple[str, ...]]] = {
+    "wins": (lambda ev: _wins(ev.m.scores), ()),
+    "points": (lambda ev: _points(ev.m.scores), ()),
+    "games": (lambda ev: _present(ev.m.scores).sum(axis=0).tolist(), ()),
+    "absences": (lambda ev: (ev.m.scores == ABSENT).sum(axis=0).tolist(), ()),
+    "win_totals": (lambda ev, wins: wins.sum(axis=0).tolist(), ("wins",)),
+    "hand_wins": (lambda ev, wins: (wins & ev.m.hand[:, None]).sum(axis=0).tolist(), ("wins",)),
+    "losses": (lambda ev: _losses(ev.m.scores).sum(axis=0).tolist(), ()),
+    "point_totals": (lambda ev, points: points.sum(axis=0).tolist(), ("points",)),
+    "max_points": (lambda ev, points: points.max(axis=0, initial=0).tolist(), ("points",)),
+    "avg_points_left": (lambda ev, point_totals, losses: [round(total / lost, 2) if lost else 0
+                                                          for total, lost in zip(point_totals, losses)],
+                        ("point_totals", "losses")),
+    "win_counts": (lambda ev, wins: _per_session(ev.m, wins).T.tolist(), ("wins",)),
+    "session_points": (lambda ev, points: _per_session(ev.m, points).T.tolist(), ("points",)),
+    "longest_streak": (lambda ev, wins: _longest_run(ev.m, wins).tolist(), ("wins",)),
+    "longest_streak_per_session": (lambda ev, wins: _longest_run(ev.m, wins, per_session=True).tolist(), ("wins",)),
+    "with_wins": (lambda ev: _with_wins(ev.m), ()),
+    "by_size": (lambda ev: _with_by_size(ev.m), ()),
+    "max_group_size": (lambda ev: _max_group_size(ev.m), ()),
+    "global_max_points": (lambda ev: calc_global_max_points(ev.m, ev.players, top_n=ev.top_n), ()),
+    "ranks": (lambda ev, win_totals, games: _ranks(ev.players, win_totals, games), ("win_totals", "games")),
+    "game_sessions": (lambda ev: (ev.m.session_index + 1).tolist(), ()),
+    "columns": (lambda ev: ev.m.scores.T.tolist(), ()),
+}
+
+def _rank_of(ranking, name):
+    return next((i + 1 for i, (n, w) in enumerate(ranking) if n == name), None)
+
+FIELDS: dict[str, tuple[_ty.Callable, tuple[str, ...]]] = {
+    "games": (lambda ev, i, games: games[i], ("games",)),
+    "absences": (lambda ev, i, absences: absences[i], ("absences",)),
+    "wins": (lambda ev, i, win_totals: win_totals[i], ("win_totals",)),
+    "romee_hand_wins": (lambda ev, i, hand_wins: hand_wins[i], ("hand_wins",)),
+    "romee_hand_win_rate": (lambda ev, i, hand_wins, games: calc_win_rate(hand_wins[i], games[i]),
+                            ("hand_wins", "games")),
+    "losses": (lambda ev, i, losses: losses[i], ("losses",)),
+    "win_rate": (lambda ev, i, win_totals, games: calc_win_rate(win_totals[i], games[i]), ("win_totals", "games")),
+    "avg_points_left": (lambda ev, i, avg_points_left: avg_points_left[i], ("avg_points_left",)),
+    "max_points": (lambda ev, i, max_points: max_points[i], ("max_points",)),
+    "total_points_absence_zero": (lambda ev, i, point_totals: point_totals[i], ("point_totals",)),
+    "total_points_absence_avg": (lambda ev, i, point_totals, absences, avg_points_left:
+                                 int(round(point_totals[i] + absences[i] * avg_points_left[i])),
+                                 ("point_totals", "absences", "avg_points_left")),
+    "sessions": (lambda ev, i: ev.m.n_sessions, ()),
+    "avg_wins_per_session": (lambda ev, i, win_counts: calc_avg_wins_per_session(win_counts[i]), ("win_counts",)),
+    "best_session_wins": (lambda ev, i, win_counts: calc_best_session_wins(win_counts[i]), ("win_counts",)),
+    "worst_session_wins": (lambda ev, i, win_counts: calc_worst_session_wins(win_counts[i]), ("win_counts",)),
+    "longest_streak": (lambda ev, i, longest_streak: longest_streak[i], ("longest_streak",)),
+    "longest_streak_per_session": (lambda ev, i, per_session: per_session[i], ("longest_streak_per_session",)),
+    "avg_points_per_session": (lambda ev, i, session_points: (round(sum(session_points[i]) / ev.m.n_sessions, 2)
+                                                              if ev.m.n_sessions else 0), ("session_points",)),
+    "game_list": (lambda ev, i, game_sessions, columns: [{'session': s_idx, 'game': idx, 'val': val} for idx, (s_idx, val)
+                                                         in enumerate(zip(game_sessions, columns[i]), 1)],
+                  ("game_sessions", "columns")),
+    "global_max_points": (lambda ev, i, global_max_points: global_max_points, ("global_max_points",)),
+    "player_max_rank": (lambda ev, i, global_max_points, max_points:
+                        calc_player_max_rank(global_max_points, ev.players[i][0], max_points[i]),
+                        ("global_max_points", "max_points")),
+    "winrank": (lambda ev, i, ranks: _rank_of(ranks[0], ev.players[i][0]), ("ranks",)),
+    "winraterank": (lambda ev, i, ranks: _rank_of(ranks[1], ev.players[i][0]), ("ranks",)),
+    "win_chance_with": (lambda ev, i, with_wins: _win_chance_with(ev.players, i, *with_wins), ("with_wins",)),
+    "win_with_by_size": (lambda ev, i, by_size: _win_with_by_size(ev.players, i, by_size), ("by_size",)),
+    "normalized_win_chance_with": (lambda ev, i, by_size, max_group_size:
+                                   _normalized_win_chance_with(ev.players, i, by_size, max_group_size),
+                                   ("by_size", "max_group_size")),
+    "max_group_size": (lambda ev, i, max_group_size: max_group_size, ("max_group_size",)),
+    "general_win_by_size": (lambda ev, i, by_size: _win_rate_by_game_size(by_size, i), ("by_size",)),
+}
+
+
+class Evaluation:
+    """
+    The INPUTS of one matrix and player list, each computed the first time it is needed and then kept.
+    seconds holds how long every input and field took (fields summed over the players), see record_metric_seconds.
+    """
+    def __init__(self, m: ScoreMatrix, players, top_n=25):
+        self.m = m
+        self.players = players
+        self.top_n = top_n
+        self._values: dict[str, _ty.Any] = {}
+        self.seconds: dict[tuple[str, str], float] = {}  # (kind, name) -> seconds
+
+    def __getitem__(self, name: str):
+        if name not in self._values:
+            func, deps = INPUTS[name]
+            inputs = [self[dep] for dep in deps]
+            start = time.perf_counter()
+            self._values[name] = func(self, *inputs)
+            self.seconds["input", name] = time.perf_counter() - start
+        return self._values[name]
+
+    def field(self, name: str, main_idx: int):
+        func, deps = FIELDS[name]
+        inputs = [self[dep] for dep in deps]
+        start = time.perf_counter()
+        value = func(self, main_idx, *inputs)
+        self.seconds["field", name] = self.seconds.get(("field", name), 0.0) + time.perf_counter() - start
+        return value
+
+
+def compute_stats(m: ScoreMatrix, players, fields=None, player_idxs=None, top_n=25) -> list[dict]:
+    """
+    {field: value} of the players at player_idxs (all of them by default), with only the FIELDS in fields
+    (all by default). Only those fields and the INPUTS they need are computed, once for all players.
+    """
+    fields = list(FIELDS) if fields is None else fields
+    player_idxs = range(len(players)) if player_idxs is None else player_idxs
+    ev = Evaluation(m, players, top_n)
+    stats = [{name: ev.field(name, main_idx) for name in fields} for main_idx in player_idxs]
+    record_metric_seconds(ev.seconds)
+    return stats
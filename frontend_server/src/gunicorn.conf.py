@@ -0,0 +1,30 @@
+"""
+Production server, run from this directory: gunicorn -c gunicorn.conf.py
+
+The app is created (database prepared, stats computed) once in the master before the workers are forked.
+Workers are recycled after MAX_REQUESTS requests, finishing what they are serving first.
+"""
+import os
+import gc
+
+# Every worker serves the stats published by whichever process refreshed them last, see snapshot.SharedSnapshot
+os.environ.setdefault("SHARED_STATS_FILE", "stats.snapshot")
+
+wsgi_app = "main:create_app()"
+bind = os.environ.get("BIND", "0.0.0.0:80")
+workers = int(os.environ.get("WORKERS", 2))
+threads = int(os.environ.get("THREADS", 4))
+worker_class = "gthread"
+preload_app = True
+max_requests = int(os.environ.get("MAX_REQUESTS", 1000))
+max_requests_jitter = max_requests // 10  # Workers are not all recycled at once
+graceful_timeout = 30
+
+
+def pre_fork(server, worker):
+    gc.freeze()  # The collector never touches the preloaded objects, so their pages stay shared
+
+
+def post_fork(server, worker):
+    import main  # Already loaded by preload_app
+    main.start_background_sync()
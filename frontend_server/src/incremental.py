@@ -0,0 +1,71 @@
+"""Running stats that only fold in the rounds added since the last refresh"""
+import copy
+
+from analyze import StatsAccumulator, STATS_CACHE
+from scorematrix import ScoreMatrix
+
+import typing as _ty
+
+
+class IncrementalStats:
+    """
+    Rounds and running aggregates of every player, keyed on the highest scores.id processed.
+
+    fold() takes the (id, score_1, ..., score_n, flag) rows past high_water, appends them to
+    the score matrix and folds them into the accumulator. A session that is still open keeps
+    collecting rounds until its separator row arrives.
+    """
+    def __init__(self, players: list[tuple[str, str]]):
+        self.players = players
+        self.high_water = 0
+        self.row_count = 0  # Distinct scores rows (separators included) up to high_water
+        self.matrix = ScoreMatrix.empty(len(players))
+        self.acc = StatsAccumulator(len(players))  # The game list comes from the matrix
+        self.checksum = 0  # Content checksum of the last update, see version
+
+    def consistent_with(self, players: list[tuple[str, str]], row_count: int) -> bool:
+        """If the processed prefix still matches the database (row_count = scores rows with id <= high_water)."""
+        return players == self.players and row_count == self.row_count
+
+    def copy(self) -> "IncrementalStats":
+        """An independent copy to fold into, a failed fold leaves this one intact (the matrix is immutable and shared)."""
+        clone = copy.copy(self)
+        clone.acc = self.acc.copy()
+        return clone
+
+    def fold(self, rows: _ty.Sequence[_ty.Sequence[int | None]]) -> int:
+        """Fold rows ordered by scores.id into the stats, returns the number of new games."""
+        if not rows:
+            return 0
+        ids = [row[0] for row in rows]
+        parsed = ScoreMatrix.parse_rows((row[1:] for row in rows), len(self.players))
+        scores, hand, offsets, _, closed = parsed
+        self.matrix, continues = self.matrix.concat(*parsed)
+
+        if not continues:
+            self.acc.end_session()
+        bounds = offsets.tolist()
+        for start, stop in zip(bounds, bounds[1:]):
+            if start:
+                self.acc.end_session()
+            for game, flag in zip(scores[start:stop].tolist(), hand[start:stop].tolist()):
+                self.acc.add_round(game, flag)
+        if closed:
+            self.acc.end_session()
+
+        self.high_water = max(self.high_water, ids[-1])
+        self.row_count += len(set(ids))
+        return len(scores)
+
+    @property
+    def version(self) -> tuple[int, int, int]:
+        """Cheap data version: (high_water, row_count, checksum)."""
+        return self.high_water, self.row_count, self.checksum
+
+    def stats(self) -> list[dict]:
+        """
+        Stats of every player, indexed like players (see analyze.StatsAccumulator.results).
+        Without game_list, that is read from the matrix when it is needed (see analyze_np.calc_game_list).
+        """
+        return STATS_CACHE.get_or_compute(("incremental", self.version, tuple(self.players)),
+                                          lambda: self.acc.results(self.players))
@@ -1,45 +1,58 @@
 """TBA"""
 import requests
-from flask import Flask, render_template, request, g, abort, redirect, url_for, jsonify
+from flask import Flask, Response, render_template, request, abort, redirect, url_for, jsonify, make_response, g, has_request_context
 import sqlite3
 import os
-from analyze import analyze_stats
+import re
+import json
+import zlib
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from analyze import STATS_CACHE, StatsCache
+from incremental import IncrementalStats
+from materialize import TABLES as STATS_TABLES, write_stats, stored_version, read_all_stats
+from analyze_np import calc_game_list_page, compute_stats, FIELDS as STATS_FIELDS
+from scorematrix import ScoreMatrix
+from sqlite_pool import ConnectionManager
+from sync_worker import SyncWorker
+from snapshot import StatsSnapshot, SharedSnapshot
+from page_cache import compress_page, best_encoding
+from profiling import instrument, span, metrics_response
+import normalized
 from werkzeug.exceptions import HTTPException
+from werkzeug.http import unquote_etag
 import traceback
-from dataclasses import dataclass
+
+import typing as _ty
 
 DB_NAME = "data.db"
+DATA_SERVER_URL = "http://192.168.20.148:8080"
 app = Flask(__name__)
+instrument(app)
+
+STATS: StatsSnapshot | None = None  # What the pages are served from, replaced as a whole
+_BUILDER: IncrementalStats | None = None  # Running stats STATS is taken from, only touched under STATS_LOCK
+STATS_LOCK = threading.Lock()  # Serializes refreshes, readers never wait for it
+# With a path every worker process serves the stats published there by whichever process refreshed last
+SHARED_STATS_FILE: str | None = os.environ.get("SHARED_STATS_FILE")
+SHARED_STATS = SharedSnapshot(SHARED_STATS_FILE) if SHARED_STATS_FILE else None
+PAGE_CACHE = StatsCache(max_entries=64, max_bytes=32 * 1024 * 1024)  # Rendered pages, see cached_page
+
+
+DB = ConnectionManager(DB_NAME)
+
+def get_db() -> sqlite3.Connection:
+    """This thread's pooled read-only connection."""
+    return DB.reader()
 
-@dataclass
-class Round:
-    player_scores: dict[str, int]
-    hand: bool
-    def __getitem__(self, item: int):
-        return list(self.player_scores.values())[item]
-    def __hash__(self):
-        return hash(f"{self.player_scores}/{self.hand}")
-@dataclass
-class Session:
-    rounds: list[Round]
-    def __getitem__(self, item: int):
-        return self.rounds[item]
-    def __hash__(self):
-        return hash(f"{self.rounds}")
-
-SESSIONS: list[Session] = []
-
-
-def get_db():
-    if "db" not in g:
-        g.db = sqlite3.connect(DB_NAME)
-        g.db.row_factory = sqlite3.Row
-    return g.db
+def get_writer_db() -> sqlite3.Connection:
+    """This thread's pooled writable connection."""
+    return DB.writer()
 
 @app.teardown_appcontext
-def close_db(error):
-    db = g.pop("db", None)
-    if db: db.close()
+def release_db(error):
+    DB.release()
 
 @app.errorhandler(Exception)
 def handle_all_errors(e):
@@ -62,11 +75,16 @@ def handle_all_errors(e):
 
 def get_players():
     db = get_db()
-    rows = db.execute("SELECT name, colname FROM players ORDER BY id").fetchall()
+    with span("db"):
+        rows = db.execute("SELECT name, colname FROM players ORDER BY id").fetchall()
     return [(row["name"], row["colname"]) for row in rows]
 
-def get_rounds() -> list[Round | None]:
+def get_rounds(since_id: int = 0) -> list[sqlite3.Row]:
+    """Raw (id, score columns..., flag) rows past since_id, session separator rows are all None's."""
     db = get_db()
+    if normalized.is_normalized(db.cursor()):
+        with span("db"):
+            return db.execute(*normalized.legacy_scores_query(db.cursor(), since_id, with_flag=True)).fetchall()
     players = get_players()
     colnames = [col for _, col in players]
 
@@ -74,177 +92,560 @@ def get_rounds() -> list[Round | None]:
         SELECT scores.id, {', '.join(colnames)}, hands.flag
         FROM scores
         LEFT JOIN hands ON scores.id = hands.scores_id
+        WHERE scores.id > ?
         ORDER BY scores.id
     """
-    rows = db.execute(query).fetchall()
-
-    rounds: list[Round | None] = []
-    for row in rows:
-        raw_scores = {name: row[col] for name, col in players}
-        flag = row["flag"]
-
-        # Determine if this is the session separator row (all None's)
-        if all(score is None for score in raw_scores.values()):
-            # Still append this as a Round (in case needed)
-            rounds.append(None)
-        else:
-            # Double scores if flag is set (but only if not None)
-            adjusted_scores = {
-                name: 1 if score is None else score * 2 if flag else score
-                for name, score in raw_scores.items()
-            }
-            rounds.append(Round(player_scores=adjusted_scores, hand=bool(flag)))
-
-    return rounds
-
-def parse_sessions(rounds: list[Round | None]) -> list[Session]:
-    global SESSIONS
-    if SESSIONS:
-        return SESSIONS
-    sessions: list[Session] = []
-    current_session: list[Round] = []
-
-    for round_ in rounds:
-        # All player scores are NULL -> delimiter, replaced by None in previous step
-        if round_ is None:
-            if current_session:
-                sessions.append(Session(rounds=current_session))
-                current_session = []
-        else:
-            current_session.append(round_)
-
-    # Final session if not already appended
-    if current_session:
-        sessions.append(Session(rounds=current_session))
-    SESSIONS = sessions
-    return sessions
-
-def update_db_from_json(data: dict):
-    db = get_db()
-    cursor = db.cursor()
+    with span("db"):
+        return db.execute(query, (since_id,)).fetchall()
+
+def latest_stats() -> StatsSnapshot | None:
+    """The newest snapshot, the shared one if there is one. None if no stats were loaded yet."""
+    if SHARED_STATS is not None:
+        return SHARED_STATS.read() or STATS
+    return STATS
+
+def current_stats() -> StatsSnapshot | None:
+    """The snapshot of this request: the first call picks the newest one, every later call gets the same."""
+    if not has_request_context():
+        return latest_stats()
+    if "stats" not in g:
+        g.stats = latest_stats()
+    return g.stats
+
+def refresh_stats() -> StatsSnapshot:
+    """
+    Fold only the rounds past the scores.id high-water mark into the running stats and publish a new snapshot.
+    If the already processed rows changed (players or row count differ) they are rebuilt from scratch.
+    The fold happens on a copy, until the new snapshot is swapped in readers keep getting the previous one.
+    """
+    global STATS, _BUILDER
+    with STATS_LOCK:
+        players = get_players()
+        builder = _BUILDER
+        if builder is not None:
+            table = normalized.rounds_table(get_db().cursor())
+            row_count = get_db().execute(f"SELECT COUNT(*) FROM {table} WHERE id <= ?", (builder.high_water,)).fetchone()[0]
+            if not builder.consistent_with(players, row_count):
+                builder = None
+        builder = IncrementalStats(players) if builder is None else builder.copy()
+        rows = get_rounds(builder.high_water)
+        with span("fold"):  # Parses the rows into the matrix and the running aggregates
+            builder.fold(rows)
+        builder.checksum = int(get_sync_meta("checksum", 0))
+        with span("stats"):
+            state = StatsSnapshot.of(builder)
+        if SHARED_STATS is not None:
+            SHARED_STATS.publish(state)
+        _BUILDER, STATS = builder, state
+        PAGE_CACHE.clear()  # Pages of older versions would never be hit again
+    return state
+
+def load_stats() -> StatsSnapshot:
+    """
+    The stats a starting process serves: the materialized ones if they are current (see load_materialized_stats),
+    otherwise they are computed from the rounds and materialized for the next start.
+    """
+    global STATS
+    with STATS_LOCK:
+        state = load_materialized_stats()
+        if state is not None:
+            if SHARED_STATS is not None:
+                SHARED_STATS.publish(state)
+            STATS = state
+            PAGE_CACHE.clear()
+    if state is None:
+        state = refresh_stats()
+        materialize_stats(state)
+    return state
+
+def get_stats(refresh: bool = False) -> StatsSnapshot:
+    """This request's stats snapshot (see current_stats), refreshed first with refresh or if none is loaded."""
+    state = current_stats()
+    if state is not None and not refresh:
+        return state
+    state = refresh_stats()
+    if has_request_context():
+        g.stats = state
+    return state
+
+def get_data_version() -> tuple[int, int, int]:
+    """(high_water, row_count, checksum) like IncrementalStats.version, read from the database if no stats are loaded."""
+    state = current_stats()
+    if state is not None:
+        return state.version
+    return read_data_version()
+
+def read_data_version() -> tuple[int, int, int]:
+    """The data version of the database, whatever stats are loaded."""
+    table = normalized.rounds_table(get_db().cursor())
+    high_water, row_count = get_db().execute(f"SELECT coalesce(MAX(id), 0), COUNT(*) FROM {table}").fetchone()
+    return high_water, row_count, int(get_sync_meta("checksum", 0))
+
+def version_key(version: tuple[int, int, int]) -> str:
+    return ".".join(str(part) for part in version)
+
+def materialize_stats(state: StatsSnapshot):
+    """Persist the stats of state, a restarted process loads them instead of computing them (see load_materialized_stats)."""
+    with STATS_LOCK, write_transaction(get_writer_db()) as cursor:
+        write_stats(cursor, list(state.players), list(state.stats), version_key(state.version))
+
+def load_materialized_stats() -> StatsSnapshot | None:
+    """
+    A snapshot of the materialized stats, None if there are none for the current data.
+    Only the score matrix is built from the rounds, the running stats are rebuilt by the next refresh.
+    """
+    players = get_players()
+    version = read_data_version()
+    if not players or stored_version(get_db(), players) != version_key(version):
+        return None
+    with span("db"):
+        all_stats = read_all_stats(get_db(), players)
+    matrix = parse_rounds(get_rounds(), players)
+    return StatsSnapshot(version, tuple(tuple(player) for player in players), matrix, tuple(all_stats))
+
+def get_sync_meta(key: str, default=None):
+    """Values recorded by /update (checksum, schema), default if none was recorded yet."""
+    try:
+        row = get_db().execute("SELECT value FROM sync_meta WHERE key = ?", (key,)).fetchone()
+    except sqlite3.OperationalError:  # No update recorded yet
+        return default
+    return row["value"] if row else default
+
+def set_sync_meta(**values):
+    """Runs inside the caller's write_transaction, next to the data it describes."""
+    db = get_writer_db()
+    db.execute("CREATE TABLE IF NOT EXISTS sync_meta (key TEXT PRIMARY KEY, value)")
+    db.executemany("INSERT OR REPLACE INTO sync_meta (key, value) VALUES (?, ?)", values.items())
+
+@contextmanager
+def write_transaction(db: sqlite3.Connection) -> _ty.Iterator[sqlite3.Cursor]:
+    """One transaction around DDL and DML alike, readers see either all of it or nothing."""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db.cursor()
+    except BaseException:
+        db.rollback()
+        raise
+    db.commit()
 
-    for table, rows in data.items():
+def table_rows(table_data: list[dict] | dict) -> tuple[list[str], list[_ty.Sequence]]:
+    """(columns, value rows) of a /get_data table, in either the row-object or the columnar layout."""
+    if isinstance(table_data, dict):
+        return table_data["columns"], table_data["rows"]
+    columns = list(dict.fromkeys(col for row in table_data for col in row))
+    return columns, [tuple(row.get(col) for col in columns) for row in table_data]
+
+def load_normalized_rounds(cursor: sqlite3.Cursor, data: dict, replace: bool):
+    """Write the scores and hands of a /get_data payload into rounds and round_scores, replace drops the old ones."""
+    columns, rows = table_rows(data.get("scores", []))
+    hand_columns, hand_rows = table_rows(data.get("hands", []))
+    flags = {}
+    if hand_rows:
+        id_idx, flag_idx = hand_columns.index("scores_id"), hand_columns.index("flag")
+        flags = {row[id_idx]: row[flag_idx] for row in hand_rows}
+    index = {col: i for i, col in enumerate(columns)}
+    known = [(row["id"], index[row["colname"]])
+             for row in cursor.execute("SELECT id, colname FROM players ORDER BY id") if row["colname"] in index]
+    if replace:
+        cursor.execute("DELETE FROM round_scores")
+        cursor.execute("DELETE FROM rounds")
+    if rows:
+        normalized.append_legacy_rows(cursor, [player_id for player_id, _ in known],
+                                      ((row[index["id"]], *(row[i] for _, i in known), flags.get(row[index["id"]]))
+                                       for row in rows))
+
+def apply_delta_from_json(data: dict):
+    """Append the rows of a /get_data?since=... delta, the tables already have the right columns."""
+    cursor = get_writer_db().cursor()
+    if normalized.is_normalized(cursor):
+        load_normalized_rounds(cursor, data, replace=False)
+        data = {table: table_data for table, table_data in data.items() if table not in ("scores", "hands")}
+
+    for table, table_data in data.items():
+        columns, rows = table_rows(table_data)
         if not rows:
-            continue  # Skip empty lists
-
-        # Clean 'scores' table by keeping only 'id' column
-        if table == "scores":
-            # Step 1: Create temp table with only 'id'
-            cursor.execute("DROP TABLE IF EXISTS _scores_temp")
-            cursor.execute("CREATE TABLE _scores_temp (id INTEGER PRIMARY KEY AUTOINCREMENT)")
-
-            # Step 2: Copy over existing IDs
-            cursor.execute("INSERT INTO _scores_temp (id) SELECT id FROM scores")
-
-            # Step 3: Drop original 'scores' table
-            cursor.execute("DROP TABLE scores")
-
-            # Step 4: Recreate 'scores' table from temp
-            cursor.execute("CREATE TABLE scores (id INTEGER PRIMARY KEY AUTOINCREMENT)")
-            cursor.execute("INSERT INTO scores (id) SELECT id FROM _scores_temp")
-            cursor.execute("DROP TABLE _scores_temp")
-
-        # Get current column names in the table
+            continue
         cursor.execute(f"PRAGMA table_info({table})")
         existing_columns = {row["name"] for row in cursor.fetchall()}
+        keep = [i for i, col in enumerate(columns) if col in existing_columns]
+        col_str = ", ".join(columns[i] for i in keep)
+        placeholders = ", ".join(["?"] * len(keep))
+        cursor.executemany(f"INSERT OR REPLACE INTO {table} ({col_str}) VALUES ({placeholders})",
+                           (tuple(row[i] for i in keep) for row in rows))
 
-        # Check all rows for new columns (assumes all rows are dicts with same keys)
-        all_columns_in_data = set()
-        for row in rows:
-            all_columns_in_data.update(row.keys())
+SHADOW_SUFFIX = "__shadow"
 
-        missing_columns = all_columns_in_data - existing_columns
+def create_shadow_table(cursor: sqlite3.Cursor, table: str, columns: list[str]) -> list[str]:
+    """
+    Create an empty copy of table to bulk-load into, returns the columns that will be filled.
 
-        # Automatically add missing columns as INTEGER
-        if table == "scores":  # Only do this for scores table as per your request
-            for col in missing_columns:
+    'scores' is rebuilt from the incoming columns (every player column is an INTEGER), other
+    tables keep their schema and only the columns they already have are loaded. Tables we
+    do not have yet are created with the incoming columns.
+    """
+    shadow = table + SHADOW_SUFFIX
+    cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+    row = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+
+    if table == "scores":
+        player_columns = [col for col in columns if col != "id"]
+        existing_columns = {r["name"] for r in cursor.execute(f"PRAGMA table_info({table})")}
+        for col in player_columns:
+            if col not in existing_columns:
                 print(f"Adding missing column to '{table}': {col}")
-                try:
-                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {col} INTEGER")
-                    existing_columns.add(col)
-                except sqlite3.OperationalError as e:
-                    print(f"Failed to add column '{col}': {e}")
-
-        # Clear the table
-        cursor.execute(f"DELETE FROM {table}")
+        col_defs = "".join(f", {col} INTEGER" for col in player_columns)
+        cursor.execute(f"CREATE TABLE {shadow} (id INTEGER PRIMARY KEY AUTOINCREMENT{col_defs})")
+        return ["id"] + player_columns
+    if row is None:
+        cursor.execute(f"CREATE TABLE {shadow} ({', '.join(columns)})")
+        return columns
+
+    cursor.execute(re.sub(rf"^CREATE TABLE\s+[\"`']?{re.escape(table)}[\"`']?", f"CREATE TABLE {shadow}", row["sql"], count=1))
+    existing_columns = {r["name"] for r in cursor.execute(f"PRAGMA table_info({shadow})")}
+    return [col for col in columns if col in existing_columns]
+
+def swap_in_shadow_table(cursor: sqlite3.Cursor, table: str):
+    indexes = [r["sql"] for r in cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))]
+    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    cursor.execute(f"ALTER TABLE {table + SHADOW_SUFFIX} RENAME TO {table}")
+    for sql in indexes:
+        cursor.execute(sql)
 
-        # Prepare and insert filtered rows
-        for row in rows:
-            filtered_row = {k: v for k, v in row.items() if k in existing_columns}
-            if not filtered_row:
-                continue
+def update_db_from_json(data: dict):
+    """
+    Replace the tables with the full /get_data payload.
 
-            columns = filtered_row.keys()
-            col_str = ", ".join(columns)
-            placeholders = ", ".join(["?"] * len(columns))
-            values = tuple(filtered_row[col] for col in columns)
+    Every table is bulk-loaded into a shadow copy with executemany and swapped in at the end.
+    Run it inside write_transaction: readers keep seeing the old tables until the commit.
+    """
+    cursor = get_writer_db().cursor()
+    rounds = None
+    if normalized.is_normalized(cursor):  # scores and hands go into rounds and round_scores instead
+        data = dict(data)
+        rounds = {table: data.pop(table) for table in ("scores", "hands") if table in data}
+
+    loaded: list[str] = []
+    for table, table_data in data.items():
+        columns, rows = table_rows(table_data)
+        if not rows:
+            continue  # Skip empty lists
 
-            insert_query = f"INSERT INTO {table} ({col_str}) VALUES ({placeholders})"
-            cursor.execute(insert_query, values)
+        load_columns = create_shadow_table(cursor, table, columns)
+        if load_columns:
+            index = {col: i for i, col in enumerate(columns)}
+            keep = [index[col] for col in load_columns]
+            placeholders = ", ".join(["?"] * len(keep))
+            cursor.executemany(f"INSERT INTO {table + SHADOW_SUFFIX} ({', '.join(load_columns)}) VALUES ({placeholders})",
+                               (tuple(row[i] for i in keep) for row in rows))
+        loaded.append(table)
 
-    db.commit()
-    db.close()
+    for table in loaded:
+        swap_in_shadow_table(cursor, table)
+    if rounds is not None:  # After the players, no table has to change for new ones
+        load_normalized_rounds(cursor, rounds, replace=True)
 
 @app.route("/init")
 def init():
+    global STATS, _BUILDER
     create_db()
+    STATS_CACHE.clear()
+    PAGE_CACHE.clear()
+    with STATS_LOCK:
+        STATS = _BUILDER = None
+    materialize_stats(get_stats(refresh=True))
     return "Database created! <a href='/'>See stats</a>"
 
-@app.route("/update")
-def update():
-    global SESSIONS
+class SyncError(Exception):
+    """A sync that failed, with the HTTP status /update answers it with."""
+    def __init__(self, message: str, status: int = 500):
+        super().__init__(message)
+        self.status = status
+
+def sync_once() -> dict[str, _ty.Any]:
+    """Pull what changed from the data server into the database and refresh the stats, raises SyncError."""
+    global _BUILDER
+    # Ask only for the rows past our highest scores id, the server sends everything if the schema changed
+    table = normalized.rounds_table(get_db().cursor())
+    since, local_count = get_db().execute(f"SELECT coalesce(MAX(id), 0), COUNT(*) FROM {table}").fetchone()
+    local_flags = normalized.flags_prefix(get_db().cursor(), since)
+    params = {"since": since, "schema": get_sync_meta("schema", ""), "layout": "columnar"}
+    etag = get_sync_meta("etag")
     try:
-        response = requests.get("http://192.168.20.148:8080/get_data")
+        response = requests.get(f"{DATA_SERVER_URL}/get_data", params=params,
+                                headers={"If-None-Match": etag} if etag else None)
+        if response.status_code == 304:  # Same data version as our last sync
+            return {"status": "success", "message": "Database already up to date", "full": False, "new_rows": 0}
         response.raise_for_status()
         update_json = response.json()
+        if not update_json["full"] and (update_json["prefix_count"] != local_count
+                                        or update_json.get("prefix_flags", local_flags) != local_flags):
+            # Rows we already have were changed or removed on the server (or got a flag), start over
+            response = requests.get(f"{DATA_SERVER_URL}/get_data", params={**params, "full": 1})
+            response.raise_for_status()
+            update_json = response.json()
     except requests.exceptions.RequestException as e:
-        return f"Update failed, could not reach server: {e}", 500
-    except ValueError:
-        return "Update failed: invalid JSON received", 400
+        raise SyncError(f"Update failed, could not reach server: {e}", 500)
+    except (ValueError, KeyError):
+        raise SyncError("Update failed: invalid JSON received", 400)
     try:
-        update_db_from_json(update_json)
+        with write_transaction(get_writer_db()):
+            if update_json["full"]:
+                update_db_from_json(update_json["tables"])
+                checksum = zlib.crc32(response.content)
+            else:
+                apply_delta_from_json(update_json["tables"])
+                checksum = zlib.crc32(response.content, int(get_sync_meta("checksum", 0)))
+            set_sync_meta(schema=update_json["schema"], checksum=checksum, etag=response.headers.get("ETag"))
     except Exception as e:
-        return f"Update failed while writing to database: {e}", 500
-    SESSIONS = []
-    return jsonify({"status": "success", "message": "Database updated successfully"})
+        raise SyncError(f"Update failed while writing to database: {e}", 500)
+    if update_json["full"]:
+        with STATS_LOCK:  # Rounds that were already folded may have changed (a flag), without the row count moving
+            _BUILDER = None
+    materialize_stats(get_stats(refresh=True))
+    return {"status": "success", "message": "Database updated successfully",
+            "full": update_json["full"], "new_rows": len(table_rows(update_json["tables"].get("scores", []))[1])}
+
+SYNC_LOCK_FILE = "sync.lock"  # Held around every sync, processes sharing the database never sync at once
+SYNC_LEADER_FILE = "sync_leader.lock"  # Held by the one process running the background sync
+
+def acquire_process_lock(path: str, blocking: bool = True) -> _ty.IO | None:
+    """
+    An exclusive lock on path shared by all processes of this machine, held until the returned file is closed.
+    None if blocking is False and another process holds it. Without fcntl (Windows) nothing is locked.
+    """
+    f = open(path, "a")
+    try:
+        import fcntl
+    except ImportError:
+        return f
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+def background_sync() -> dict[str, _ty.Any]:
+    try:
+        with acquire_process_lock(SYNC_LOCK_FILE):
+            return sync_once()
+    finally:
+        DB.release()  # The worker thread has no request teardown
+
+def watch_changes(timeout: float) -> bool:
+    """Long-poll the data server's /changes until its data differs from our last sync, see SyncWorker."""
+    try:
+        etag = get_sync_meta("etag")
+    finally:
+        DB.release()
+    if not etag:
+        return False
+    since, _ = unquote_etag(etag)
+    response = requests.get(f"{DATA_SERVER_URL}/changes", params={"since": since, "timeout": min(timeout, CHANGES_TIMEOUT)},
+                            timeout=min(timeout, CHANGES_TIMEOUT) + 10)
+    response.raise_for_status()
+    return True
+
+# Syncs as soon as the data server reports a change, and every minute (+-10%) regardless.
+# Backs off up to 15 minutes while the data server is unreachable.
+SYNC_INTERVAL = 60.0
+SYNC_JITTER = 0.1
+SYNC_MAX_BACKOFF = 15 * 60.0
+CHANGES_TIMEOUT = 55.0  # Below the data server's limit for one long-poll
+SYNC_WORKER = SyncWorker(background_sync, SYNC_INTERVAL, SYNC_JITTER, SYNC_MAX_BACKOFF, watch=watch_changes)
+
+_SYNC_LEADER: _ty.IO | None = None
+
+def start_background_sync():
+    """
+    Run SYNC_WORKER in only one of the worker processes sharing the database, whichever gets SYNC_LEADER_FILE.
+    The others wait for it in the background and take over once the leader exits (e.g. when it is recycled).
+    """
+    def lead():
+        global _SYNC_LEADER
+        _SYNC_LEADER = acquire_process_lock(SYNC_LEADER_FILE)  # Released when this process exits
+        SYNC_WORKER.start()
+    threading.Thread(target=lead, name="sync-leader", daemon=True).start()
+
+@app.route("/update")
+def update():
+    try:
+        return jsonify(SYNC_WORKER.run_once())
+    except SyncError as e:
+        return str(e), e.status
+
+@app.route("/sync_status")
+def sync_status():
+    return jsonify(SYNC_WORKER.status())
+
+def _pages_version() -> str:
+    """Changes with the code and templates, so a deploy never gets served from a browser's cache."""
+    base = os.path.dirname(os.path.abspath(__file__))
+    paths = [os.path.join(base, name) for name in os.listdir(base) if name.endswith(".py")]
+    paths += [os.path.join(base, "templates", name) for name in os.listdir(os.path.join(base, "templates"))]
+    return f"{zlib.crc32(repr(sorted((p, os.stat(p).st_mtime_ns) for p in paths)).encode()):08x}"
+
+PAGES_VERSION = _pages_version()
+
+def conditional_on_data_version(view):
+    """
+    ETag the page with the stats data version and answer a matching If-None-Match with 304,
+    before anything is computed or rendered.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = f"{PAGES_VERSION}-{version_key(get_data_version())}"
+        if request.if_none_match.contains_weak(etag):
+            resp = make_response("", 304)
+        else:
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+        resp.set_etag(etag, weak=True)
+        resp.headers["Cache-Control"] = "no-cache"  # Always revalidate, it is cheap
+        return resp
+    return wrapper
+
+def cached_page(view):
+    """
+    Serve the page from PAGE_CACHE, keyed by the path, the query arguments and the data version.
+    Pages are compressed once when they are rendered, every coding is kept and the one the
+    client accepts is sent as it is. New data means a new version, so a stale page is never served.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.path, tuple(sorted(request.args.items(multi=True))), version_key(get_data_version()))
+        page = PAGE_CACHE.get(key)
+        hit = page is not None
+        if page is None:
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+            page = PAGE_CACHE.put(key, (resp.content_type, compress_page(resp.get_data())))
+        content_type, bodies = page
+        encoding = best_encoding(bodies, request.accept_encodings)
+        resp = make_response(bodies[encoding])
+        resp.content_type = content_type
+        if encoding != "identity":
+            resp.headers["Content-Encoding"] = encoding
+        resp.headers["Vary"] = "Accept-Encoding"
+        resp.headers["X-Cache"] = "HIT" if hit else "MISS"
+        return resp
+    return wrapper
+
+@app.route("/metrics")
+def metrics():
+    return metrics_response()
+
+@app.route("/stats_cache")
+def stats_cache():
+    return jsonify(STATS_CACHE.info())
+
+@app.route("/page_cache")
+def page_cache():
+    return jsonify(PAGE_CACHE.info())
 
 @app.route("/")
 def home():
     return render_template("home.html")
 
 @app.route("/individual")
+@conditional_on_data_version
+@cached_page
 def individual_stats():
     db_players = get_players()
     if not db_players:
         abort(404, "No players found! Did you initialize the DB?")
     player = request.args.get("player") or db_players[0][0]
-    players = db_players
+    state = get_stats()  # One snapshot for the whole page
+    players = state.players
     player_idx = [i for i, p in enumerate(players) if p[0] == player]
     if not player_idx:
         abort(404, f"Player '{player}' not found")
     idx = player_idx[0]
-    sessions = parse_sessions(get_rounds())
-    stats = analyze_stats(sessions, players, idx)
+    # The game list is not part of the page, it is loaded from /api/game_list
+    stats = state.stats[idx]
     return render_template("individual_stats.html",
         players=[p[0] for p in players],
         player=player,
         stats=stats,
     )
 
+GAME_LIST_PAGE_SIZE = 50
+GAME_LIST_MAX_PAGE_SIZE = 500
+
+@app.route("/api/game_list")
+@conditional_on_data_version
+def game_list():
+    """
+    One page of a player's game list: ?player=<name>&cursor=<next_cursor of the previous page>&limit=<games>,
+    optionally only ?session=<number> and games with ?min=<val> and/or ?max=<val> (0 is a win, 1 an absence).
+        {"player": ..., "games": [{"session": ..., "game": ..., "val": ...}], "next_cursor": null on the last page}
+    """
+    db_players = get_players()
+    player = request.args.get("player") or (db_players[0][0] if db_players else None)
+    after = max(request.args.get("cursor", 0, type=int), 0)  # A negative one would slice from the end
+    limit = min(max(request.args.get("limit", GAME_LIST_PAGE_SIZE, type=int), 1), GAME_LIST_MAX_PAGE_SIZE)
+    filters = dict(session=request.args.get("session", type=int),
+                   min_val=request.args.get("min", type=int), max_val=request.args.get("max", type=int))
+    state = get_stats()
+    player_idx = [i for i, p in enumerate(state.players) if p[0] == player]
+    if not player_idx:
+        abort(404, f"Player '{player}' not found")
+    games, next_cursor = calc_game_list_page(state.matrix, player_idx[0], after, limit, **filters)
+    return jsonify(player=player, games=games, next_cursor=next_cursor)
+
+def parse_rounds(rows: list[sqlite3.Row], players: list[tuple[str, str]]) -> ScoreMatrix:
+    with span("parse"):
+        return ScoreMatrix.from_rows((tuple(row)[1:] for row in rows), len(players))
+
+def list_arg(name: str) -> list[str] | None:
+    """A comma-separated (or repeated) query argument, None if it is missing."""
+    values = [value for arg in request.args.getlist(name) for value in arg.split(",") if value]
+    return values or None
+
+@app.route("/api/stats")
+@conditional_on_data_version
+def api_stats():
+    """
+    Selected stats as compact JSON: ?players=<name>,...&fields=<field>,... (both default to all)
+        {"version": ..., "fields": [...], "stats": {player: {field: value}}}
+    Only the requested fields and what they depend on are computed from the score matrix of the loaded stats
+    (see analyze_np.FIELDS), for all requested players at once, and kept in STATS_CACHE for the data version.
+    """
+    fields = list_arg("fields") or list(STATS_FIELDS)
+    unknown = [field for field in fields if field not in STATS_FIELDS]
+    if unknown:
+        abort(400, f"Unknown fields {', '.join(unknown)}, available: {', '.join(STATS_FIELDS)}")
+    state = get_stats()
+    names = list_arg("players") or [player[0] for player in state.players]
+    idxs = {player[0]: idx for idx, player in enumerate(state.players)}
+    missing = [name for name in names if name not in idxs]
+    if missing:
+        abort(404, f"Players {', '.join(missing)} not found")
+    player_idxs = [idxs[name] for name in names]
+    version = version_key(state.version)
+    values = STATS_CACHE.get_or_compute(("api_stats", version, state.players, tuple(player_idxs), tuple(fields)),
+                                        lambda: compute_stats(state.matrix, state.players, fields, player_idxs))
+    body = {"version": version, "fields": fields, "stats": dict(zip(names, values))}
+    return Response(json.dumps(body, separators=(",", ":")), mimetype="application/json")
+
 @app.route("/global")
+@conditional_on_data_version
+@cached_page
 def global_stats():
     db_players = get_players()
     if not db_players:
         abort(404, "No players found! Did you initialize the DB?")
-    players = db_players
-    sessions = parse_sessions(get_rounds())
+    state = get_stats()
+    players, player_stats = state.players, state.stats
 
     # Gather stats for each player, indexed by name
-    all_stats = []
-    for idx, player in enumerate(players):
-        stat = analyze_stats(sessions, players, idx)
-        stat["player"] = player[0]  # Use player name for easier Jinja
-        all_stats.append(stat)
+    all_stats = [
+        dict(stat, player=player[0])  # Use player name for easier Jinja
+        for player, stat in zip(players, player_stats)
+    ]
 
     # Build each table list, ranked
     table_games = sorted(all_stats, key=lambda s: -s["games"])
@@ -282,6 +683,11 @@ def create_db(players: list[tuple[str, str]] | None = None, games: list[tuple[in
     c.execute("DROP TABLE IF EXISTS scores")
     c.execute("DROP TABLE IF EXISTS players")
     c.execute("DROP TABLE IF EXISTS hands")
+    c.execute("DROP TABLE IF EXISTS round_scores")
+    c.execute("DROP TABLE IF EXISTS rounds")
+    c.execute("DROP TABLE IF EXISTS sync_meta")  # Forget the last sync, the next /update is a full one
+    for table in STATS_TABLES:
+        c.execute(f"DROP TABLE IF EXISTS {table}")
     c.execute("PRAGMA foreign_keys = ON;")
 
     c.execute("""
@@ -296,6 +702,7 @@ def create_db(players: list[tuple[str, str]] | None = None, games: list[tuple[in
     columns = ", ".join(f"{col} INTEGER" for _, col in good_players)
     c.execute(f"CREATE TABLE scores (id INTEGER PRIMARY KEY AUTOINCREMENT, {columns})")
     c.execute("CREATE TABLE hands (scores_id INTEGER REFERENCES scores(id), flag INTEGER)")
+    c.execute(normalized.HANDS_INDEX)
 
     placeholders = ", ".join(["?"] * len(good_players))
     c.executemany(f"INSERT INTO scores ({', '.join([col for _, col in good_players])}) VALUES ({placeholders})", good_games)
@@ -304,7 +711,25 @@ def create_db(players: list[tuple[str, str]] | None = None, games: list[tuple[in
     conn.close()
 
 
-if __name__ == "__main__":
+def create_app() -> Flask:
+    """
+    The app, ready to serve: the database exists and the stats (materialized ones if current) and templates are loaded.
+    A pre-forking server calls it once before forking (see gunicorn.conf.py), the workers
+    share what it loaded copy-on-write and their first requests are as fast as any later one.
+    """
     if not os.path.exists(DB_NAME):
         create_db()
+    with sqlite3.connect(DB_NAME) as conn:
+        normalized.ensure_hands_index(conn.cursor())
+    load_stats()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)  # Compiled and cached
+    DB.close_all()  # SQLite connections must not be carried over into forked processes
+    return app
+
+
+if __name__ == "__main__":  # Development server, see gunicorn.conf.py for production
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":  # Only in the reloader's serving process
+        create_app()
+        SYNC_WORKER.start()
     app.run(port=80, host="0.0.0.0", debug=True)
@@ -0,0 +1,125 @@
+"""Per-player stats persisted to SQLite at update time, so a restarted server loads them instead of recomputing them"""
+import sqlite3
+
+import typing as _ty
+
+# Result keys of analyze.StatsAccumulator.results that are plain numbers, one player_stats column each
+SCALAR_FIELDS: list[str] = [
+    "games", "absences", "wins", "romee_hand_wins", "romee_hand_win_rate", "losses", "win_rate",
+    "avg_points_left", "max_points", "total_points_absence_zero", "total_points_absence_avg", "sessions",
+    "avg_wins_per_session", "best_session_wins", "worst_session_wins", "longest_streak",
+    "longest_streak_per_session", "avg_points_per_session", "player_max_rank", "winrank", "winraterank",
+    "max_group_size",
+]
+GENERAL = -1  # size_stats.other_idx of the rows that are not about another player (general_win_by_size)
+
+# Value columns are declared without a type, so ints stay ints and floats stay floats (0 vs 0.0 on the pages)
+SCHEMA: list[str] = [
+    f"""CREATE TABLE IF NOT EXISTS player_stats (
+        player_idx INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        {', '.join(SCALAR_FIELDS)}
+    )""",
+    """CREATE TABLE IF NOT EXISTS pair_stats (
+        player_idx INTEGER NOT NULL,
+        other_idx INTEGER NOT NULL,
+        other_name TEXT NOT NULL,
+        win_chance_with,
+        normalized_win_chance_with,
+        PRIMARY KEY (player_idx, other_idx)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS size_stats (
+        player_idx INTEGER NOT NULL,
+        other_idx INTEGER NOT NULL,
+        num_players INTEGER NOT NULL,
+        rate, fair, diff, games,
+        PRIMARY KEY (player_idx, other_idx, num_players)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS max_points_ranking (
+        position INTEGER PRIMARY KEY,
+        rank INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        val
+    )""",
+    "CREATE TABLE IF NOT EXISTS stats_meta (key TEXT PRIMARY KEY, value)",
+]
+TABLES: list[str] = ["player_stats", "pair_stats", "size_stats", "max_points_ranking", "stats_meta"]
+
+
+def create_stats_tables(cursor: sqlite3.Cursor):
+    for sql in SCHEMA:
+        cursor.execute(sql)
+
+
+def write_stats(cursor: sqlite3.Cursor, players: list[tuple[str, str]], all_stats: list[dict], version: str):
+    """
+    Replace the materialized stats with all_stats (indexed like players) under the data version.
+    Game lists are not stored, they are read from the score matrix of the rounds.
+    """
+    create_stats_tables(cursor)
+    cursor.execute("DROP TABLE IF EXISTS game_list")  # Written by older versions
+    for table in ("player_stats", "pair_stats", "size_stats", "max_points_ranking"):
+        cursor.execute(f"DELETE FROM {table}")
+
+    cursor.executemany(
+        f"INSERT INTO player_stats (player_idx, name, {', '.join(SCALAR_FIELDS)}) "
+        f"VALUES (?, ?, {', '.join(['?'] * len(SCALAR_FIELDS))})",
+        ((idx, player[0], *(stats[field] for field in SCALAR_FIELDS))
+         for idx, (player, stats) in enumerate(zip(players, all_stats))))
+
+    names = {player[0]: idx for idx, player in enumerate(players)}
+    cursor.executemany(
+        "INSERT OR REPLACE INTO pair_stats (player_idx, other_idx, other_name, win_chance_with, normalized_win_chance_with) "
+        "VALUES (?, ?, ?, ?, ?)",
+        ((idx, names[name], name, rate, stats["normalized_win_chance_with"].get(name, 0))
+         for idx, stats in enumerate(all_stats) for name, rate in stats["win_chance_with"].items()))
+    cursor.executemany(
+        "INSERT OR REPLACE INTO size_stats (player_idx, other_idx, num_players, rate, fair, diff, games) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(idx, names[row["player"]], row["num_players"], row["rate"], row["fair"], row["diff"], row["games"])
+         for idx, stats in enumerate(all_stats) for row in stats["win_with_by_size"]]
+        + [(idx, GENERAL, row["num_players"], row["rate"], row["fair"], row["diff"], row["games"])
+           for idx, stats in enumerate(all_stats) for row in stats["general_win_by_size"]])
+    if all_stats:
+        cursor.executemany("INSERT INTO max_points_ranking (position, rank, name, val) VALUES (?, ?, ?, ?)",
+                           ((pos, *entry) for pos, entry in enumerate(all_stats[0]["global_max_points"])))
+    cursor.executemany("INSERT OR REPLACE INTO stats_meta (key, value) VALUES (?, ?)",
+                       (("version", version), ("players", repr(players))))
+
+
+def stored_version(db: sqlite3.Connection, players: list[tuple[str, str]]) -> str | None:
+    """Data version the materialized stats were computed for, None if there are none for these players."""
+    try:
+        meta = dict(db.execute("SELECT key, value FROM stats_meta").fetchall())
+    except sqlite3.OperationalError:  # Never materialized
+        return None
+    return meta.get("version") if meta.get("players") == repr(players) else None
+
+
+def read_stats(db: sqlite3.Connection, players: list[tuple[str, str]], player_idx: int) -> dict[str, _ty.Any]:
+    """One player's stats, the same dict analyze.StatsAccumulator.results returns for them (without the game list)."""
+    row = db.execute(f"SELECT {', '.join(SCALAR_FIELDS)} FROM player_stats WHERE player_idx = ?",
+                     (player_idx,)).fetchone()
+    stats: dict[str, _ty.Any] = dict(zip(SCALAR_FIELDS, row))
+
+    pairs = db.execute("SELECT other_name, win_chance_with, normalized_win_chance_with FROM pair_stats "
+                       "WHERE player_idx = ? ORDER BY other_idx", (player_idx,)).fetchall()
+    stats["win_chance_with"] = {name: rate for name, rate, _ in pairs}
+    stats["normalized_win_chance_with"] = {name: rate for name, _, rate in pairs}
+
+    sizes = db.execute("SELECT other_idx, num_players, rate, fair, diff, games FROM size_stats "
+                       "WHERE player_idx = ? ORDER BY other_idx, num_players", (player_idx,)).fetchall()
+    stats["win_with_by_size"] = [
+        {"player": players[other][0], "num_players": n, "rate": rate, "fair": fair, "diff": diff, "games": games}
+        for other, n, rate, fair, diff, games in sizes if other != GENERAL]
+    stats["general_win_by_size"] = [
+        {"num_players": n, "rate": rate, "fair": fair, "diff": diff, "games": games}
+        for other, n, rate, fair, diff, games in sizes if other == GENERAL]
+
+    stats["global_max_points"] = [tuple(r) for r in db.execute(
+        "SELECT rank, name, val FROM max_points_ranking ORDER BY position").fetchall()]
+    return stats
+
+
+def read_all_stats(db: sqlite3.Connection, players: list[tuple[str, str]]) -> list[dict[str, _ty.Any]]:
+    return [read_stats(db, players, idx) for idx in range(len(players))]
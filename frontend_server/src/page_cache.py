@@ -0,0 +1,24 @@
+"""Rendered pages, compressed once when they are built and then served as they are"""
+import gzip
+
+try:
+    import brotli
+except ImportError:  # In requirements.txt, without it (dev setups) pages are gzip-compressed only
+    brotli = None
+
+import typing as _ty
+
+ENCODINGS = ("br", "gzip", "identity")  # In order of preference when the client accepts several equally
+
+
+def compress_page(body: bytes) -> dict[str, bytes]:
+    """{content coding: body} of every coding the page is served in."""
+    bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(body, quality=11)
+    return bodies
+
+
+def best_encoding(bodies: dict[str, bytes], accept_encodings: _ty.Any) -> str:
+    """The coding of bodies to send for the request's Accept-Encoding (a werkzeug Accept)."""
+    return accept_encodings.best_match([encoding for encoding in ENCODINGS if encoding in bodies], default="identity")
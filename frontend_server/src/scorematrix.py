@@ -0,0 +1,123 @@
+"""Compact, array-backed storage for the rounds of all sessions"""
+import numpy as np
+
+import typing as _ty
+
+SCORE_DTYPE = np.int16
+ABSENT = 1  # Absent players score 1, like in the rest of the stats code
+
+
+class ScoreMatrix:
+    """
+    All rounds as an int16 games x players score matrix.
+
+    Hand flags and absences are kept as bitmaps (np.packbits), and sessions as an
+    array of row offsets: session i spans rows session_offsets[i]:session_offsets[i + 1].
+    Scores are already adjusted the way the stats expect them (absent -> 1, flagged -> doubled).
+    """
+    __slots__ = ("scores", "hand_bits", "absent_bits", "session_offsets", "closed")
+
+    def __init__(self, scores: np.ndarray, hand: np.ndarray, session_offsets: np.ndarray, closed: bool = True):
+        self.scores = np.ascontiguousarray(scores, dtype=SCORE_DTYPE)
+        self.hand_bits = np.packbits(np.asarray(hand, dtype=bool))
+        self.absent_bits = np.packbits(self.scores == ABSENT, axis=1)
+        self.session_offsets = np.asarray(session_offsets, dtype=np.int32)
+        for array in (self.scores, self.hand_bits, self.absent_bits, self.session_offsets):
+            array.flags.writeable = False
+        self.closed = closed  # False while the last session has not seen its separator row yet
+
+    @staticmethod
+    def parse_rows(rows: _ty.Iterable[_ty.Sequence[int | None]], n_players: int):
+        """Raw rows -> (scores, hand, session offsets, leading separator, closed), see from_rows."""
+        data = np.array([tuple(row) for row in rows], dtype=object).reshape(-1, n_players + 1)
+        missing = np.equal(data[:, :n_players], None)
+        separator = missing.all(axis=1) if n_players else np.zeros(len(data), dtype=bool)
+        flag = np.where(np.equal(data[:, n_players], None), 0, data[:, n_players]).astype(bool)
+
+        scores = np.where(missing, 0, data[:, :n_players]).astype(np.int32)
+        scores = np.where(flag[:, None], scores * 2, scores)  # Double scores if flag is set
+        scores[missing] = ABSENT
+
+        keep = ~separator
+        # Rows kept before each separator are the session boundaries, empty sessions collapse
+        boundaries = np.cumsum(keep)[separator]
+        n_games = int(keep.sum())
+        offsets = np.unique(np.concatenate(([0], boundaries, [n_games])))
+        leading_separator = bool(len(data)) and bool(separator[0])
+        closed = not n_games or bool(separator[-1])
+        return scores[keep], flag[keep], offsets, leading_separator, closed
+
+    @classmethod
+    def from_rows(cls, rows: _ty.Iterable[_ty.Sequence[int | None]], n_players: int) -> "ScoreMatrix":
+        """
+        Build a matrix from raw (score_1, ..., score_n, flag) rows.
+        A row where every score is NULL ends the current session.
+        """
+        scores, hand, offsets, _, closed = cls.parse_rows(rows, n_players)
+        return cls(scores, hand, offsets, closed)
+
+    @classmethod
+    def from_buffers(cls, scores: np.ndarray, hand_bits: np.ndarray, absent_bits: np.ndarray,
+                     session_offsets: np.ndarray, closed: bool) -> "ScoreMatrix":
+        """A matrix over already packed arrays (e.g. memory-mapped ones), nothing is copied or recomputed."""
+        matrix = cls.__new__(cls)
+        matrix.scores, matrix.hand_bits, matrix.absent_bits = scores, hand_bits, absent_bits
+        matrix.session_offsets = session_offsets
+        for array in (scores, hand_bits, absent_bits, session_offsets):
+            array.flags.writeable = False
+        matrix.closed = closed
+        return matrix
+
+    @classmethod
+    def empty(cls, n_players: int) -> "ScoreMatrix":
+        return cls(np.zeros((0, n_players)), np.zeros(0, dtype=bool), np.zeros(1))
+
+    def concat(self, scores: np.ndarray, hand: np.ndarray, offsets: np.ndarray,
+               leading_separator: bool, closed: bool) -> tuple["ScoreMatrix", bool]:
+        """Append parsed rows (see parse_rows), returns the new matrix and whether they continued the last session."""
+        if not len(scores):
+            return ScoreMatrix(self.scores, self.hand, self.session_offsets, self.closed or leading_separator), False
+        continues = self.n_games > 0 and not (self.closed or leading_separator)
+        head = self.session_offsets[:-1] if continues else self.session_offsets
+        matrix = ScoreMatrix(np.concatenate((self.scores, scores)),
+                             np.concatenate((self.hand, hand)),
+                             np.concatenate((head, offsets[1:] + self.n_games)),
+                             closed)
+        return matrix, continues
+
+    @property
+    def n_games(self) -> int:
+        return self.scores.shape[0]
+
+    @property
+    def n_players(self) -> int:
+        return self.scores.shape[1]
+
+    @property
+    def n_sessions(self) -> int:
+        return len(self.session_offsets) - 1
+
+    @property
+    def hand(self) -> np.ndarray:
+        return np.unpackbits(self.hand_bits, count=self.n_games).astype(bool)
+
+    @property
+    def absent(self) -> np.ndarray:
+        return np.unpackbits(self.absent_bits, axis=1, count=self.n_players).astype(bool)
+
+    @property
+    def session_index(self) -> np.ndarray:
+        """0-based session of every game."""
+        return np.repeat(np.arange(self.n_sessions, dtype=np.int32), np.diff(self.session_offsets))
+
+    @property
+    def nbytes(self) -> int:
+        return self.scores.nbytes + self.hand_bits.nbytes + self.absent_bits.nbytes + self.session_offsets.nbytes
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ScoreMatrix):
+            return NotImplemented
+        return (self.scores.shape == other.scores.shape
+                and np.array_equal(self.scores, other.scores)
+                and np.array_equal(self.hand_bits, other.hand_bits)
+                and np.array_equal(self.session_offsets, other.session_offsets))
@@ -0,0 +1,130 @@
+"""Immutable, versioned stats snapshots, optionally published to a file every worker process maps"""
+from dataclasses import dataclass
+import threading
+import pickle
+import struct
+import json
+import mmap
+import os
+
+import numpy as np
+
+from incremental import IncrementalStats
+from scorematrix import ScoreMatrix
+
+import typing as _ty
+
+MAGIC = b"RSNAP001"
+HEADER = struct.Struct("<8sQ")  # Magic, length of the JSON header that follows
+ALIGN = 16
+ARRAYS = ("scores", "hand_bits", "absent_bits", "session_offsets")
+
+
+@dataclass(frozen=True)
+class StatsSnapshot:
+    """
+    The parsed rounds and the stats of every player (indexed like players) at one data version.
+    Replaced as a whole, never modified: the matrix is read-only and the stats must be treated as such.
+    The stats have no game_list, the game lists are read from the (shared) matrix.
+    """
+    version: tuple[int, int, int]
+    players: tuple[tuple[str, str], ...]
+    matrix: ScoreMatrix
+    stats: tuple[dict, ...]
+
+    @classmethod
+    def of(cls, state: IncrementalStats) -> "StatsSnapshot":
+        return cls(state.version, tuple(tuple(player) for player in state.players), state.matrix, tuple(state.stats()))
+
+
+def dump(snapshot: StatsSnapshot) -> bytes:
+    """
+    Header (magic, JSON length), JSON with the version, players and where everything is,
+    the matrix arrays (aligned, so they can be used in place) and the pickled stats.
+    """
+    arrays = {name: getattr(snapshot.matrix, name) for name in ARRAYS}
+    stats = pickle.dumps(snapshot.stats, pickle.HIGHEST_PROTOCOL)
+    layout: dict[str, _ty.Any] = {"version": snapshot.version, "players": snapshot.players,
+                                  "closed": snapshot.matrix.closed, "arrays": {}}
+    # The offsets depend on the header length and the other way round, grow the header until it fits
+    header_size = 256
+    while True:
+        offset = HEADER.size + header_size
+        for name, array in arrays.items():
+            offset += -offset % ALIGN
+            layout["arrays"][name] = [offset, array.dtype.str, array.shape]
+            offset += array.nbytes
+        layout["stats"] = [offset, len(stats)]
+        header = json.dumps(layout).encode()
+        if len(header) <= header_size:
+            break
+        header_size = len(header) * 2
+    parts = [HEADER.pack(MAGIC, header_size), header.ljust(header_size)]
+    position = HEADER.size + header_size
+    for name, array in arrays.items():
+        start = layout["arrays"][name][0]
+        parts.append(b"\0" * (start - position))
+        parts.append(array.tobytes())
+        position = start + array.nbytes
+    parts.append(stats)
+    return b"".join(parts)
+
+
+def load(buffer: _ty.Any) -> StatsSnapshot:
+    """The snapshot in buffer (see dump), the matrix arrays are views of it, not copies."""
+    magic, header_size = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError("not a stats snapshot")
+    layout = json.loads(bytes(buffer[HEADER.size:HEADER.size + header_size]))
+    arrays = {}
+    for name, (offset, dtype, shape) in layout["arrays"].items():
+        count = int(np.prod(shape)) if shape else 1
+        arrays[name] = np.frombuffer(buffer, dtype=np.dtype(dtype), count=count, offset=offset).reshape(shape)
+    offset, length = layout["stats"]
+    stats = pickle.loads(buffer[offset:offset + length])
+    matrix = ScoreMatrix.from_buffers(*(arrays[name] for name in ARRAYS), layout["closed"])
+    return StatsSnapshot(tuple(layout["version"]), tuple(tuple(player) for player in layout["players"]),
+                         matrix, tuple(stats))
+
+
+class SharedSnapshot:
+    """
+    A snapshot file shared by the worker processes of one server: whoever refreshes the stats publishes
+    them, the others map the file instead of rebuilding them. The file is replaced atomically, and the
+    pages of the mapped matrix are shared between all processes through the OS page cache.
+    Publishing replaces a file other processes may have mapped, which needs a POSIX system.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._identity: tuple[int, int, int] | None = None  # (inode, mtime, size) of the file read last
+        self._snapshot: StatsSnapshot | None = None
+        self._lock = threading.Lock()
+
+    def publish(self, snapshot: StatsSnapshot):
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(dump(snapshot))
+            f.flush()
+            os.fsync(f.fileno())
+            st = os.fstat(f.fileno())
+        os.replace(tmp, self.path)
+        with self._lock:  # Our own snapshot, no need to map it again
+            self._identity, self._snapshot = (st.st_ino, st.st_mtime_ns, st.st_size), snapshot
+
+    def read(self) -> StatsSnapshot | None:
+        """The last published snapshot, None if nothing was published yet. Only mapped again once it changed."""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            st = os.fstat(f.fileno())
+            identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+            with self._lock:
+                if identity == self._identity:
+                    return self._snapshot
+            # The arrays keep the mapping alive, it goes away with the last snapshot using it
+            snapshot = load(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        with self._lock:
+            self._identity, self._snapshot = identity, snapshot
+        return snapshot
@@ -0,0 +1,57 @@
+// Fill a game list table from /api/game_list, one page at a time while its end is scrolled into view
+function lazyGameList(table, sentinel, url) {
+    let cursor = 0;
+    let loading = false;
+
+    function addRow(game) {
+        const row = table.insertRow();
+        const session = row.insertCell();
+        session.className = "session-id";
+        session.textContent = game.session;
+        const result = row.insertCell().appendChild(document.createElement("span"));
+        if (game.val === 0) {
+            result.className = "win";
+            result.textContent = "Win";
+        } else if (game.val === 1) {
+            result.className = "absent";
+            result.textContent = "Absent";
+        } else {
+            result.className = "points";
+            result.textContent = `${game.val} points left`;
+        }
+    }
+
+    async function loadPage() {
+        if (loading || cursor === null) {
+            return;
+        }
+        loading = true;
+        try {
+            const separator = url.includes("?") ? "&" : "?";
+            const res = await fetch(`${url}${separator}cursor=${cursor}`);
+            const page = await res.json();
+            page.games.forEach(addRow);
+            cursor = page.next_cursor;
+            if (cursor === null) {
+                observer.disconnect();
+                sentinel.remove();
+            }
+        } catch (err) {
+            sentinel.textContent = "Could not load the game list.";
+            observer.disconnect();
+        } finally {
+            loading = false;
+        }
+        // Still in view (short pages or a tall window), keep going
+        if (cursor !== null && sentinel.getBoundingClientRect().top < window.innerHeight) {
+            loadPage();
+        }
+    }
+
+    const observer = new IntersectionObserver((entries) => {
+        if (entries.some((entry) => entry.isIntersecting)) {
+            loadPage();
+        }
+    }, {rootMargin: "400px"});
+    observer.observe(sentinel);
+}
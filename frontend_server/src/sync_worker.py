@@ -0,0 +1,112 @@
+"""Periodic background sync with jitter and exponential backoff"""
+import threading
+import random
+import time
+
+import typing as _ty
+
+
+class SyncWorker:
+    """
+    Calls sync() on a daemon thread every interval seconds, randomized by +-jitter (a fraction of it).
+    After a failure the wait doubles with every consecutive failure, up to max_backoff seconds.
+    sync() returns a JSON-able result or raises, status() reports how the last run went.
+
+    With watch(timeout) the worker blocks in it instead of sleeping, it returns once there is something
+    to sync or the timeout passed (True), or False if it could not watch (then the worker sleeps as usual).
+    While syncs fail the worker always sleeps, so the backoff applies.
+    """
+    def __init__(self, sync: _ty.Callable[[], _ty.Any], interval: float = 60.0, jitter: float = 0.1,
+                 max_backoff: float = 15 * 60.0, watch: _ty.Callable[[float], bool] | None = None):
+        self.sync = sync
+        self.watch = watch
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.runs = self.failures = self.consecutive_failures = 0
+        self.last_started: float | None = None
+        self.last_finished: float | None = None
+        self.last_success: float | None = None
+        self.last_duration: float | None = None
+        self.last_result: _ty.Any = None
+        self.last_error: str | None = None
+        self.next_run: float | None = None
+        self._lock = threading.Lock()  # One sync at a time, scheduled or triggered
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def delay(self) -> float:
+        """Seconds until the next scheduled run."""
+        delay = self.interval * 2 ** self.consecutive_failures if self.consecutive_failures else self.interval
+        delay = min(delay, max(self.max_backoff, self.interval))
+        return max(0.0, delay * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def run_once(self) -> _ty.Any:
+        """Sync now (waits for a running sync to finish first), returns its result or raises its error."""
+        with self._lock:
+            self.last_started = time.time()
+            start = time.perf_counter()
+            try:
+                result = self.sync()
+            except Exception as e:
+                self.failures += 1
+                self.consecutive_failures += 1
+                self.last_error = str(e)
+                raise
+            else:
+                self.consecutive_failures = 0
+                self.last_success = time.time()
+                self.last_result = result
+                self.last_error = None
+                return result
+            finally:
+                self.runs += 1
+                self.last_duration = time.perf_counter() - start
+                self.last_finished = time.time()
+
+    def _watch(self, delay: float) -> bool:
+        try:
+            return self.watch(delay)
+        except Exception:
+            return False
+
+    def _loop(self):
+        while not self._stop.is_set():
+            delay = self.delay()
+            self.next_run = time.time() + delay
+            if self.watch is None or self.consecutive_failures or self._wake.is_set() or not self._watch(delay):
+                self._wake.wait(delay)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.run_once()
+            except Exception:
+                pass  # Recorded in status(), the next run backs off
+
+    def start(self, run_now: bool = True):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        if run_now:
+            self._wake.set()
+        self._thread = threading.Thread(target=self._loop, name="sync-worker", daemon=True)
+        self._thread.start()
+
+    def trigger(self):
+        """Run the next sync right away instead of waiting for the schedule."""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def status(self) -> dict[str, _ty.Any]:
+        return dict(running=self._thread is not None and self._thread.is_alive(), busy=self._lock.locked(),
+                    runs=self.runs, failures=self.failures, consecutive_failures=self.consecutive_failures,
+                    last_started=self.last_started, last_finished=self.last_finished,
+                    last_success=self.last_success, last_duration=self.last_duration,
+                    last_result=self.last_result, last_error=self.last_error, next_run=self.next_run,
+                    interval=self.interval, jitter=self.jitter, max_backoff=self.max_backoff,
+                    watching=self.watch is not None)
@@ -0,0 +1,75 @@
+import random
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+SEEDS = range(8)
+
+
+def random_rows(seed: int, n_players: int = 5, n_rounds: int = 400) -> list[tuple]:
+    """
+    (id, score_1, ..., score_n, flag) rows like get_rounds returns them: NULL for absent players,
+    one winner per round, ties, group sizes down to one player, flags and all-NULL session separators.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for row_id in range(1, n_rounds + 1):
+        if rng.random() < 0.08:
+            rows.append((row_id, *[None] * n_players, rng.choice((None, 0))))
+            continue
+        present = [i for i in range(n_players) if rng.random() < 0.8] or [rng.randrange(n_players)]
+        scores = [None] * n_players
+        for i in present:
+            scores[i] = rng.choice((0, 1, 2, 5, 8, 10, 15, 22, 40, 60)) if rng.random() < 0.3 else rng.randint(2, 70)
+        scores[rng.choice(present)] = 0
+        rows.append((row_id, *scores, rng.choice((None, 0, 0, 0, 1))))
+    return rows
+
+
+@pytest.fixture(params=SEEDS)
+def rounds(request) -> tuple[list[tuple[str, str]], list[tuple]]:
+    """(players, rows) of a random history."""
+    players = [(f"P{i}", f"player{i + 1}") for i in range(5)]
+    return players, random_rows(request.param, len(players))
+
+
+@pytest.fixture(autouse=True)
+def clear_stats_cache():
+    """Results are cached on the data version, which the random histories share."""
+    from analyze import STATS_CACHE
+    STATS_CACHE.clear()
+    yield
+    STATS_CACHE.clear()
+
+
+def get_data_payload(players: list[tuple[str, str]], rows: list[tuple]) -> dict:
+    """The tables of a full /get_data response (columnar layout) with the rows, like the data server sends them."""
+    return {
+        "players": {"columns": ["id", "name", "colname"],
+                    "rows": [[idx, name, col] for idx, (name, col) in enumerate(players, 1)]},
+        "scores": {"columns": ["id", *(col for _, col in players)], "rows": [list(row[:-1]) for row in rows]},
+        "hands": {"columns": ["scores_id", "flag"], "rows": [[row[0], row[-1]] for row in rows if row[-1] is not None]},
+    }
+
+
+@pytest.fixture
+def app(rounds, tmp_path, monkeypatch):
+    """The frontend's main module after create_app, serving the random history from a database in tmp_path."""
+    import main
+    from sqlite_pool import ConnectionManager
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "DB", ConnectionManager(main.DB_NAME))
+    monkeypatch.setattr(main, "STATS", None)
+    monkeypatch.setattr(main, "_BUILDER", None)
+    main.PAGE_CACHE.clear()
+    main.create_db()
+    with main.write_transaction(main.get_writer_db()):
+        main.update_db_from_json(get_data_payload(*rounds))
+    main.DB.close_all()
+    main.create_app()
+    yield main
+    main.DB.close_all()
+    main.PAGE_CACHE.clear()
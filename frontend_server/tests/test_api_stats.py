@@ -0,0 +1,27 @@
+import json
+
+import reference_stats
+
+
+def test_api_stats_matches_baseline(app, rounds):
+    players, rows = rounds
+    expected = json.loads(json.dumps(reference_stats.analyze_all_stats(rows, players)))
+    body = app.app.test_client().get("/api/stats").get_json()
+    assert body["stats"] == {player[0]: stats for player, stats in zip(players, expected)}
+
+
+def test_api_stats_selects_players_and_fields(app, rounds):
+    players, rows = rounds
+    expected = json.loads(json.dumps(reference_stats.analyze_all_stats(rows, players)))
+    fields = ["game_list", "wins", "player_max_rank", "win_with_by_size"]
+    client = app.app.test_client()
+    for _ in range(2):  # Computed, then from STATS_CACHE
+        body = client.get(f"/api/stats?players=P3,P1&fields={','.join(fields)}").get_json()
+        assert body["fields"] == fields
+        assert body["stats"] == {name: {field: expected[idx][field] for field in fields} for name, idx in (("P3", 3), ("P1", 1))}
+
+
+def test_api_stats_rejects_unknown_fields_and_players(app):
+    client = app.app.test_client()
+    assert client.get("/api/stats?fields=wins,nope").status_code == 400
+    assert client.get("/api/stats?players=Nobody").status_code == 404
@@ -0,0 +1,20 @@
+import reference_stats
+
+
+def test_pages_cover_the_game_list(app, rounds):
+    players, rows = rounds
+    expected = reference_stats.analyze_all_stats(rows, players)[2]["game_list"]
+    client = app.app.test_client()
+    games, cursor = [], 0
+    while cursor is not None:
+        body = client.get(f"/api/game_list?player=P2&cursor={cursor}&limit=64").get_json()
+        games += body["games"]
+        cursor = body["next_cursor"]
+    assert games == expected
+
+
+def test_negative_cursor_starts_at_the_first_game(app):
+    client = app.app.test_client()
+    first = client.get("/api/game_list?player=P0&limit=5").get_json()
+    assert client.get("/api/game_list?player=P0&limit=5&cursor=-3").get_json() == first
+    assert first["games"][0]["game"] == 1
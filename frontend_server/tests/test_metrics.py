@@ -0,0 +1,33 @@
+from prometheus_client.parser import text_string_to_metric_families
+
+from analyze import STATS_CACHE
+
+
+def samples(client) -> dict[tuple[str, tuple], float]:
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    return {(sample.name, tuple(sorted(sample.labels.items()))): sample.value
+            for family in text_string_to_metric_families(resp.get_data(as_text=True)) for sample in family.samples}
+
+
+def metric_count(values: dict, metric: str, kind: str) -> float:
+    return values.get(("romee_metric_seconds_count", (("kind", kind), ("metric", metric))), 0)
+
+
+def test_served_stats_are_timed_per_metric(app):
+    client = app.app.test_client()
+    before = samples(client)
+    app._BUILDER = None
+    STATS_CACHE.clear()
+    app.refresh_stats()  # What the pages are served from
+    after = samples(client)
+    for metric in ("global_max_points", "ranks", "totals", "win_with", "general_win_by_size"):
+        assert metric_count(after, metric, "result") == metric_count(before, metric, "result") + 1
+
+
+def test_requests_are_timed(app):
+    client = app.app.test_client()
+    resp = client.get("/api/stats?fields=wins")
+    assert "metrics;dur=" in resp.headers["Server-Timing"]
+    key = ("romee_request_seconds_count", (("method", "GET"), ("route", "/api/stats"), ("status", "200")))
+    assert samples(client)[key] >= 1
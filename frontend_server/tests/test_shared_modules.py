@@ -0,0 +1,13 @@
+import os
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+SHARED = ["profiling.py", "sqlite_pool.py", "normalized.py"]  # Copied verbatim into both servers, each is deployed on its own
+
+
+@pytest.mark.parametrize("name", SHARED)
+def test_shared_module_copies_are_identical(name):
+    with open(os.path.join(ROOT, "frontend_server", "src", name), "rb") as frontend, \
+            open(os.path.join(ROOT, "data_server", "src", name), "rb") as data_server:
+        assert frontend.read() == data_server.read(), f"{name} differs between the servers, change both copies"
@@ -0,0 +1,49 @@
+import random
+
+from incremental import IncrementalStats
+from analyze_np import calc_game_list, compute_stats
+from scorematrix import ScoreMatrix
+
+import reference_stats
+
+
+def without_game_list(stats: list[dict]) -> list[dict]:
+    return [{key: value for key, value in stat.items() if key != "game_list"} for stat in stats]
+
+
+def test_accumulator_matches_baseline(rounds):
+    players, rows = rounds
+    state = IncrementalStats(players)
+    state.fold(rows)
+    expected = reference_stats.analyze_all_stats(rows, players)
+    assert state.stats() == without_game_list(expected)
+    assert [calc_game_list(state.matrix, idx) for idx in range(len(players))] == [stat["game_list"] for stat in expected]
+
+
+def test_registry_matches_baseline(rounds):
+    players, rows = rounds
+    matrix = ScoreMatrix.from_rows([row[1:] for row in rows], len(players))
+    expected = reference_stats.analyze_all_stats(rows, players)
+    assert compute_stats(matrix, players) == expected
+    fields, player_idxs = ["wins", "game_list", "winraterank", "normalized_win_chance_with"], [3, 0]
+    assert compute_stats(matrix, players, fields, player_idxs) == [{field: expected[idx][field] for field in fields}
+                                                                   for idx in player_idxs]
+
+
+def test_incremental_folds_match_baseline(rounds):
+    players, rows = rounds
+    rng = random.Random(len(rows))
+    cuts = sorted(rng.sample(range(1, len(rows)), 6))
+    state = IncrementalStats(players)
+    for start, stop in zip([0, *cuts], [*cuts, len(rows)]):
+        previous = state
+        state = state.copy()
+        state.fold(rows[start:stop])
+        assert previous.stats() == without_game_list(reference_stats.analyze_all_stats(rows[:start], players))
+    assert state.stats() == without_game_list(reference_stats.analyze_all_stats(rows, players))
+    assert state.matrix == ScoreMatrix.from_rows([row[1:] for row in rows], len(players))
+
+
+def test_empty_history_matches_baseline():
+    players = [("A", "player1"), ("B", "player2")]
+    assert IncrementalStats(players).stats() == without_game_list(reference_stats.analyze_all_stats([], players))